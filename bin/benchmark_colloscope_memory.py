@@ -0,0 +1,41 @@
+"""
+Measure the memory used by the colloscopes, and the time spent to format the colles dates.
+
+Must be executed from the root of the project. By default, every colloscope from external_data is loaded, as the bot
+does.
+"""
+
+import sys
+import timeit
+import tracemalloc
+from glob import glob
+
+import typer
+
+sys.path.insert(0, "./src")
+
+from cogs.colloscope_helper import colloscope_maker as cm  # noqa: E402
+
+
+def main(inputs: list[str] = typer.Argument(None), number: int = 10):
+    files = inputs or [f for f in glob("./external_data/colloscopes/*.csv") if not f.endswith("example.csv")]
+
+    tracemalloc.start()
+    colloscopes = [cm.Colloscope.from_filename(f) for f in files]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    colles = [c for colloscope in colloscopes for c in colloscope.colles]
+    print(f"{len(files)} files, {len(colles)} colles")
+    print(f"memory: {current / 1024:.1f} KiB ({current / max(len(colles), 1):.0f} B/colle), peak: {peak / 1024:.1f} KiB")
+
+    def format_all():
+        for c in colles:
+            _ = c.str_date, c.str_time, c.long_str_date
+
+    total = timeit.timeit(format_all, number=number)
+    print(f"formatting: {total / number * 1000:.2f} ms for all the colles")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,40 @@
+"""
+Measure the time saved by reusing the PDF template (fonts loaded once, table header already drawn) in the PDF export.
+
+Must be executed from the root of the project, for the fonts to be found.
+"""
+
+import sys
+import timeit
+
+import typer
+
+sys.path.insert(0, "./src")
+
+from cogs.colloscope_helper import colloscope_maker as cm  # noqa: E402
+
+
+def main(input: str, group: str, number: int = 20):
+    colloscope = cm.Colloscope.from_filename(input)
+    colles = colloscope.get_group_colles(group)
+    if not colles:
+        raise typer.BadParameter(f"No colle found for the group {group}.")
+
+    def export():
+        cm.export_colles("pdf", colles, group, colloscope.holidays)
+
+    def cold_export():
+        cm.get_pdf_template.cache_clear()
+        export()
+
+    export()  # warm up
+    results = {
+        "new template": timeit.timeit(cold_export, number=number),
+        "cached template": timeit.timeit(export, number=number),
+    }
+    for name, total in results.items():
+        print(f"{name:<16} {total / number * 1000:8.1f} ms/export")
+
+
+if __name__ == "__main__":
+    typer.run(main)
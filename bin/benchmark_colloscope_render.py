@@ -0,0 +1,51 @@
+"""
+Compare the two ways of rendering a colloscope preview:
+- the PDF export rasterized by poppler (pdf2image)
+- the direct Pillow renderer
+
+Must be executed from the root of the project, for the fonts to be found.
+"""
+
+import io
+import sys
+import timeit
+
+import typer
+from pdf2image.pdf2image import convert_from_bytes
+
+sys.path.insert(0, "./src")
+
+from cogs.colloscope_helper import colloscope_image as ci, colloscope_maker as cm  # noqa: E402
+
+
+def pdf_path(colles: list[cm.ColleData], group: str, colloscope: cm.Colloscope) -> list[bytes]:
+    buffer = io.BytesIO()
+    cm.write_colles(buffer, "pdf", colles, group, colloscope.holidays)
+    pages: list[bytes] = []
+    for img in convert_from_bytes(buffer.getvalue()):
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format="png")
+        pages.append(img_buffer.getvalue())
+    return pages
+
+
+def main(input: str, group: str, number: int = 20):
+    colloscope = cm.Colloscope.from_filename(input)
+    colles = colloscope.get_group_colles(group)
+    if not colles:
+        raise typer.BadParameter(f"No colle found for the group {group}.")
+
+    # warm up (fonts loading, etc...)
+    pdf_path(colles, group, colloscope)
+    ci.draw_colles(colles, group, colloscope.holidays)
+
+    results = {
+        "fpdf + poppler": timeit.timeit(lambda: pdf_path(colles, group, colloscope), number=number),
+        "pillow": timeit.timeit(lambda: ci.draw_colles(colles, group, colloscope.holidays), number=number),
+    }
+    for name, total in results.items():
+        print(f"{name:<15} {total / number * 1000:8.1f} ms/render")
+
+
+if __name__ == "__main__":
+    typer.run(main)
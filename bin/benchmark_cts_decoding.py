@@ -0,0 +1,145 @@
+"""
+Compare the decoding of a stop-monitoring response:
+- the previous walk in the dict tree, keeping `datetime` objects
+- the decoding into `StopTime` records
+
+The responses are generated, with `visits` vehicles each. The memory is the size of the result alone, the decoded
+payload being dropped afterward.
+
+Must be executed from the root of the project.
+"""
+
+import gc
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+import typer
+
+sys.path.insert(0, "./src")
+os.environ.setdefault("CTS_TOKEN", "")  # no request is made
+
+from libraries.cts.decoding import decode_stop_times, parse_arrival_time
+
+
+class DictStopTime(NamedTuple):
+    type: str
+    destination: str
+    line: str
+    arrival: datetime
+
+
+def dict_walk(response: Any) -> list[DictStopTime]:
+    times: list[DictStopTime] = []
+    for tmp in response["ServiceDelivery"]["StopMonitoringDelivery"][0]["MonitoredStopVisit"]:
+        vehicle = tmp["MonitoredVehicleJourney"]
+        if vehicle["VehicleMode"] not in ("bus", "tram"):
+            continue
+        times.append(
+            DictStopTime(
+                type=vehicle["VehicleMode"],
+                destination=vehicle["DestinationName"] or "??",
+                line=vehicle["LineRef"] or "??",
+                arrival=datetime.fromisoformat(vehicle["MonitoredCall"]["ExpectedArrivalTime"]),
+            )
+        )
+    return times
+
+
+def generate_response(visits: int) -> str:
+    now = datetime.fromisoformat("2024-03-11T14:00:00+01:00")
+    lines = [("A", "Graffenstaden"), ("C", "Neuhof Rodolphe Reuss"), ("F", "Elsau"), ("L1", "Lingolsheim Tiergaertel")]
+    stop_visits: list[dict[str, Any]] = []
+    for i in range(visits):
+        line, destination = random.choice(lines)  # noqa: S311
+        arrival = (now + timedelta(seconds=random.randrange(3600))).isoformat()  # noqa: S311
+        stop_visits.append(
+            {
+                "RecordedAtTime": now.isoformat(),
+                "MonitoringRef": "233A",
+                "StopCode": "233A",
+                "MonitoredVehicleJourney": {
+                    "LineRef": line,
+                    "DirectionRef": i % 2,
+                    "FramedVehicleJourneyRef": {"DatedVehicleJourneySAERef": f"SAE:{i}"},
+                    "VehicleMode": "tram" if len(line) == 1 else "bus",
+                    "PublishedLineName": line,
+                    "DestinationName": destination,
+                    "DestinationShortName": destination[:10],
+                    "Via": None,
+                    "MonitoredCall": {
+                        "StopPointName": "Homme de Fer",
+                        "StopCode": "233A",
+                        "Order": i,
+                        "ExpectedDepartureTime": arrival,
+                        "ExpectedArrivalTime": arrival,
+                        "Extension": {"IsRealTime": True, "DataSource": None},
+                        "PreviousCall": None,
+                        "OnwardCall": None,
+                    },
+                },
+            }
+        )
+    return json.dumps(
+        {
+            "ServiceDelivery": {
+                "ResponseTimestamp": now.isoformat(),
+                "RequestMessageRef": None,
+                "StopMonitoringDelivery": [
+                    {
+                        "version": "2.0",
+                        "ResponseTimestamp": now.isoformat(),
+                        "ValidUntil": now.isoformat(),
+                        "ShortestPossibleCycle": "PT30S",
+                        "MonitoringRef": None,
+                        "MonitoredStopVisit": stop_visits,
+                    }
+                ],
+                "VehicleMonitoringDelivery": None,
+                "EstimatedTimetableDelivery": None,
+                "GeneralMessageDelivery": None,
+            }
+        }
+    )
+
+
+def retained_memory(decoder: Callable[[Any], Any], raw: str) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = decoder(json.loads(raw))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(visits: int = 500, number: int = 200):
+    raw = generate_response(visits)
+    response = json.loads(raw)
+
+    # the cache is cleared before each run, so every date is parsed
+    cold = min(
+        timeit.repeat(
+            lambda: decode_stop_times(response), setup=parse_arrival_time.cache_clear, number=1, repeat=number
+        )
+    )
+
+    decoders: dict[str, Callable[[Any], Any]] = {"dict walk": dict_walk, "decoding": decode_stop_times}
+    for name, decoder in decoders.items():
+        total = timeit.timeit(lambda: decoder(response), number=number)
+        print(
+            f"{name:<10} {total / number * 1e6:8.1f} µs/response "
+            f"{retained_memory(decoder, raw) / 1024:8.1f} KiB retained"
+        )
+    print(f"decoding, with an empty cache: {cold * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    typer.run(main)
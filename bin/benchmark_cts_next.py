@@ -0,0 +1,123 @@
+"""
+Measure the fetch-and-render path of /cts_next (get_stop_times + build_embeds) under concurrency, against the CTS API
+stand-in from bin/cts_stand_in.py, started in a separate process.
+
+The stops are requested at random among the `stops` first ones. Use `ttl` to change the duration of the stop times
+cache (0 disables it), and see how many requests actually reach the API.
+
+Must be executed from the root of the project.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import statistics
+import sys
+import time
+from multiprocessing import Process
+from typing import TYPE_CHECKING, cast
+
+import typer
+from aiohttp import web
+from cts_stand_in import create_app
+
+sys.path.insert(0, "./src")
+
+if TYPE_CHECKING:
+    from bot import MP2IBot
+
+
+def serve(port: int, latency: float, jitter: float, error_rate: float) -> None:
+    web.run_app(
+        create_app(latency=latency, jitter=jitter, error_rate=error_rate),
+        host="127.0.0.1",
+        port=port,
+        print=None,
+        access_log=None,
+    )
+
+
+def wait_for_port(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+        else:
+            return
+
+
+async def benchmark(requests: int, concurrency: int, stops: int, ttl: float) -> None:
+    # imported here, once the environment variables are set
+    from cogs.cts import CTS
+    from core._config import Config
+    from core.errors import BaseError
+    from core.http_client import http_client
+    from libraries import cts
+
+    Config.define_config()
+    cts.STOP_TIMES_TTL = ttl
+    cog = CTS(cast("MP2IBot", None))
+    try:
+        cog.load_stops(await cts.get_stops())
+        stop_refs = list(cog.stops)[:stops]
+        upstream_before = cts.get_stats().requests
+
+        latencies: list[float] = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def cts_next() -> None:
+            nonlocal errors
+            async with semaphore:
+                stop = cog.stops[random.choice(stop_refs)]  # noqa: S311
+                start = time.perf_counter()
+                try:
+                    cog.build_embeds(stop, await cts.get_stop_times(stop.ref))
+                except BaseError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(cts_next() for _ in range(requests)))
+        total = time.perf_counter() - start
+    finally:
+        await http_client.aclose()
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f"{requests} requests, {concurrency} concurrent, {len(stop_refs)} stops, cache TTL {ttl}s")
+    print(f"p50 {percentiles[49] * 1000:.1f}ms, p99 {percentiles[98] * 1000:.1f}ms, max {max(latencies) * 1000:.1f}ms")
+    print(f"{requests / total:.0f} requests/s, {errors} errors")
+    print(f"cache: {cts.stop_times_cache_stats}, {cts.get_stats().requests - upstream_before} requests to the API")
+
+
+def main(
+    requests: int = 5000,
+    concurrency: int = 200,
+    stops: int = 50,
+    ttl: float = 30,
+    latency: float = 50,
+    jitter: float = 20,
+    error_rate: float = 0,
+    port: int = 8765,
+):
+    logging.basicConfig(level=logging.ERROR)
+    os.environ["CTS_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("CTS_TOKEN", "")
+
+    server = Process(target=serve, args=(port, latency, jitter, error_rate), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        asyncio.run(benchmark(requests, concurrency, stops, ttl))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,220 @@
+"""
+A local stand-in for the CTS API, to work on the `cts` extension (and to benchmark it) without a CTS_TOKEN.
+
+It serves the stoppoints-discovery, lines-discovery and stop-monitoring endpoints used by `libraries.cts`. The
+payloads are replayed from the recordings directory if given:
+- `stoppoints-discovery.json`
+- `lines-discovery.json`
+- `stop-monitoring/<MonitoringRef>.json`, or `stop-monitoring.json` for every stop
+Anything missing is generated, with the shape of `libraries/cts/models.py`.
+
+Every request is delayed by `latency` ± `jitter` milliseconds, and a proportion `error_rate` of them fails with a 429,
+500 or 503 status. Only the stop-monitoring requests fail, unless `discovery_errors` is set.
+
+To use it with the bot, set the environment variable CTS_API_BASE_URL=http://127.0.0.1:8765 (any token is accepted).
+"""
+
+import asyncio
+import json
+import random
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import typer
+from aiohttp import web
+
+LINES = [
+    ("A", "tram", ["Graffenstaden", "Parc des Sports"]),
+    ("C", "tram", ["Neuhof Rodolphe Reuss", "Gare Centrale"]),
+    ("F", "tram", ["Elsau", "Place d'Islande"]),
+    ("L1", "bus", ["Lingolsheim Tiergaertel", "Robertsau Sainte-Anne"]),
+    ("10", "bus", ["Gare Centrale", "Pont Phario"]),
+]
+
+
+def generate_stops(count: int) -> dict[str, Any]:
+    stop_points: list[dict[str, Any]] = []
+    for i in range(count):
+        lines = random.sample(LINES, k=2)
+        # a stop point per direction, sharing the LogicalStopCode
+        stop_points.extend(
+            {
+                "StopPointRef": f"{i}{direction}",
+                "Lines": [
+                    {
+                        "LineRef": line,
+                        "LineName": line,
+                        "Destinations": None,
+                        "Extension": {"RouteType": mode, "RouteColor": None, "RouteTextColor": None},
+                    }
+                    for line, mode, _ in lines
+                ],
+                "Location": {"Longitude": 7.7 + i / 1000, "Latitude": 48.5 + i / 1000},
+                "StopName": f"Arrêt {i}",
+                "Extension": {
+                    "StopCode": f"{i}{direction}",
+                    "LogicalStopCode": str(i),
+                    "IsFlexhopStop": False,
+                    "distance": None,
+                },
+            }
+            for direction in "AB"
+        )
+    return {
+        "StopPointsDelivery": {
+            "ResponseTimestamp": datetime.now(UTC).isoformat(),
+            "RequestMessageRef": None,
+            "AnnotatedStopPointRef": stop_points,
+        }
+    }
+
+
+def generate_lines() -> dict[str, Any]:
+    now = datetime.now(UTC)
+    return {
+        "LinesDelivery": {
+            "ResponseTimestamp": now.isoformat(),
+            "RequestMessageRef": None,
+            "ValidUntil": (now + timedelta(days=1)).isoformat(),
+            "ShortestPossibleCycle": "PT30S",
+            "AnnotatedLineRef": [
+                {
+                    "LineRef": line,
+                    "LineName": line,
+                    "Destinations": [
+                        {"DirectionRef": i, "DestinationName": [destination]}
+                        for i, destination in enumerate(destinations)
+                    ],
+                    "Extension": {"RouteType": mode, "RouteColor": None, "RouteTextColor": None},
+                }
+                for line, mode, destinations in LINES
+            ],
+        }
+    }
+
+
+def generate_stop_monitoring(stop_ref: str, visits: int = 20) -> dict[str, Any]:
+    now = datetime.now(UTC).replace(microsecond=0)
+    stop_visits: list[dict[str, Any]] = []
+    for i in range(visits):
+        line, mode, destinations = random.choice(LINES)  # noqa: S311
+        arrival = (now + timedelta(seconds=random.randrange(3600))).isoformat()  # noqa: S311
+        stop_visits.append(
+            {
+                "RecordedAtTime": now.isoformat(),
+                "MonitoringRef": stop_ref,
+                "StopCode": stop_ref,
+                "MonitoredVehicleJourney": {
+                    "LineRef": line,
+                    "DirectionRef": i % 2,
+                    "FramedVehicleJourneyRef": {"DatedVehicleJourneySAERef": f"SAE:{i}"},
+                    "VehicleMode": mode,
+                    "PublishedLineName": line,
+                    "DestinationName": destinations[i % 2],
+                    "DestinationShortName": None,
+                    "Via": None,
+                    "MonitoredCall": {
+                        "StopPointName": f"Arrêt {stop_ref}",
+                        "StopCode": stop_ref,
+                        "Order": None,
+                        "ExpectedDepartureTime": arrival,
+                        "ExpectedArrivalTime": arrival,
+                        "Extension": {"IsRealTime": True, "DataSource": None},
+                        "PreviousCall": None,
+                        "OnwardCall": None,
+                    },
+                },
+            }
+        )
+    return {
+        "ServiceDelivery": {
+            "ResponseTimestamp": now.isoformat(),
+            "RequestMessageRef": None,
+            "StopMonitoringDelivery": [
+                {
+                    "version": "2.0",
+                    "ResponseTimestamp": now.isoformat(),
+                    "ValidUntil": (now + timedelta(seconds=30)).isoformat(),
+                    "ShortestPossibleCycle": "PT30S",
+                    "MonitoringRef": [stop_ref],
+                    "MonitoredStopVisit": stop_visits,
+                }
+            ],
+            "VehicleMonitoringDelivery": None,
+            "EstimatedTimetableDelivery": None,
+            "GeneralMessageDelivery": None,
+        }
+    }
+
+
+def read_recording(recordings: Path | None, name: str) -> bytes | None:
+    if recordings is None or not (recordings / name).is_file():
+        return None
+    return (recordings / name).read_bytes()
+
+
+def create_app(
+    recordings: Path | None = None,
+    stops: int = 500,
+    latency: float = 50,
+    jitter: float = 20,
+    error_rate: float = 0,
+    discovery_errors: bool = False,
+) -> web.Application:
+    """Create the stand-in application. The latencies are in milliseconds."""
+    stops_payload = (
+        read_recording(recordings, "stoppoints-discovery.json") or json.dumps(generate_stops(stops)).encode()
+    )
+    lines_payload = read_recording(recordings, "lines-discovery.json") or json.dumps(generate_lines()).encode()
+
+    @web.middleware
+    async def degrade(request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
+        await asyncio.sleep(max(0, random.uniform(latency - jitter, latency + jitter)) / 1000)  # noqa: S311
+        failing = discovery_errors or request.path.endswith("/stop-monitoring")
+        if failing and random.random() < error_rate:  # noqa: S311
+            status = random.choice((429, 500, 503))  # noqa: S311
+            return web.Response(status=status, headers={"Retry-After": "1"} if status == 429 else None)
+        return await handler(request)
+
+    async def stoppoints_discovery(request: web.Request) -> web.Response:
+        return web.Response(body=stops_payload, content_type="application/json")
+
+    async def lines_discovery(request: web.Request) -> web.Response:
+        return web.Response(body=lines_payload, content_type="application/json")
+
+    async def stop_monitoring(request: web.Request) -> web.Response:
+        stop_ref = request.query.get("MonitoringRef")
+        if not stop_ref:
+            return web.Response(status=400)
+        payload = read_recording(recordings, f"stop-monitoring/{Path(stop_ref).name}.json") or read_recording(
+            recordings, "stop-monitoring.json"
+        )
+        if payload is None:
+            payload = json.dumps(generate_stop_monitoring(stop_ref)).encode()
+        return web.Response(body=payload, content_type="application/json")
+
+    app = web.Application(middlewares=[degrade])
+    app.router.add_get("/v1/siri/2.0/stoppoints-discovery", stoppoints_discovery)
+    app.router.add_get("/v1/siri/2.0/lines-discovery", lines_discovery)
+    app.router.add_get("/v1/siri/2.0/stop-monitoring", stop_monitoring)
+    return app
+
+
+def main(
+    recordings: Path | None = None,
+    port: int = 8765,
+    stops: int = 500,
+    latency: float = 50,
+    jitter: float = 20,
+    error_rate: float = 0,
+    discovery_errors: bool = False,
+):
+    web.run_app(
+        create_app(recordings, stops, latency, jitter, error_rate, discovery_errors), host="127.0.0.1", port=port
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,15 +1,61 @@
+"""
+Convert the colloscopes files to the format used by the bot.
+
+The input can be a single file, or a directory: in that case, every .csv file from it is converted (in parallel) to the
+output directory.
+The converted files are also validated with the parser used by the bot, and are only written if they are valid.
+
+Must be executed from the root of the project.
+"""
+
 import csv
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from glob import glob
 
 import typer
 
+sys.path.insert(0, "./src")
+
+from cogs.colloscope_helper import colloscope_maker as cm  # noqa: E402
+
 
 class Version(Enum):
     MPI = "MPI"
     MP2I = "MP2I"
 
 
-def main(input: str, output: str, version: Version):
+def main(input: str, output: str, version: Version, workers: int | None = None):
+    if not os.path.isdir(input):
+        convert(input, output, version)
+        return
+
+    os.makedirs(output, exist_ok=True)
+    inputs = glob(os.path.join(input, "*.csv"))
+    outputs = [os.path.join(output, os.path.basename(f)) for f in inputs]
+
+    failed = False
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert, i, o, version) for i, o in zip(inputs, outputs)]
+        for filename, future in zip(inputs, futures):
+            try:
+                duration = future.result()
+            except Exception as e:
+                failed = True
+                print(f"{filename}: {e}")
+            else:
+                print(f"{filename}: ok ({duration:.1f}ms to parse)")
+
+    if failed:
+        raise typer.Exit(1)
+
+
+def convert(input: str, output: str, version: Version) -> float:
+    """Convert a file, and return the time (in ms) taken by the bot to parse it."""
     with open(input, newline="") as csvfile:
         reader = csv.reader(csvfile, delimiter=";")
         lines = list(reader)
@@ -19,9 +65,20 @@ def main(input: str, output: str, version: Version):
     elif version == Version.MP2I:
         new_lines = lines
 
-    with open(output, "w", newline="") as csvfile:
-        writer = csv.writer(csvfile, delimiter=",")
-        writer.writerows(new_lines)
+    buffer = io.StringIO(newline="")
+    writer = csv.writer(buffer, delimiter=",")
+    writer.writerows(new_lines)
+    content = buffer.getvalue().encode()
+
+    # validate the file before writing it
+    start = time.perf_counter()
+    cm.Colloscope.from_csv(content)
+    duration = (time.perf_counter() - start) * 1000
+
+    with open(output, "wb") as csvfile:
+        csvfile.write(content)
+
+    return duration
 
 
 def transform_mpi(lines: list[list[str]]):
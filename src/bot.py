@@ -9,6 +9,7 @@ from discord.ext import commands
 
 from core._config import config
 from core.custom_command_tree import CustomCommandTree
+from core.http_client import http_client
 from core.personal_infos_loader import PersonalInformation, load_personal_informations
 from core.utils import BraceMessage as __
 
@@ -57,6 +58,10 @@ class MP2IBot(commands.Bot):
         await self.load_extensions()
         await self.sync_tree()
 
+    async def close(self) -> None:
+        await super().close()
+        await http_client.aclose()
+
     async def sync_tree(self) -> None:
         for guild_id in self.tree.active_guild_ids:
             await self.tree.sync(guild=discord.Object(guild_id))
@@ -12,6 +12,7 @@ from discord import app_commands
 from discord.ext.commands import Cog  # pyright: ignore[reportMissingTypeStubs]
 
 from core._config import config
+from core.http_client import HostStats, http_client
 from core.personal_infos_loader import load_personal_informations
 
 if TYPE_CHECKING:
@@ -50,6 +51,39 @@ class Admin(Cog):
         await self.bot.sync_tree()
         await inter.edit_original_response(content="Tree successfully synchronized.")
 
+    @app_commands.command()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.guilds(config.guild_id)
+    async def http_stats(self, inter: Interaction):
+        lines: list[str] = []
+        shown: list[HostStats] = []
+
+        # the libraries can't be imported without their API key, which is only required if their extension is loaded
+        try:
+            from libraries import cts
+        except KeyError:
+            pass
+        else:
+            shown.append(cts.get_stats())
+            lines.append(f"**CTS** : {shown[-1]}")
+            lines.append(f"- stop times cache : {cts.stop_times_cache_stats}")
+            lines.append(f"- circuit breaker : {cts.api_circuit_breaker}")
+
+        try:
+            from libraries import openweathermap
+        except KeyError:
+            pass
+        else:
+            shown.append(openweathermap.get_stats())
+            lines.append(f"**OpenWeatherMap** : {shown[-1]}")
+
+        lines.extend(
+            f"`{host}` : {stats}"
+            for host, stats in http_client.stats.items()
+            if not any(stats is other for other in shown)
+        )
+        await inter.response.send_message("\n".join(lines) or "No request made yet.")
+
     @app_commands.command()
     @app_commands.default_permissions(administrator=True)
     @app_commands.guilds(config.guild_id)
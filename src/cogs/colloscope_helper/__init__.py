@@ -3,18 +3,20 @@ from __future__ import annotations
 import io
 import logging
 import os
+import time
 from functools import partial
 from glob import glob
-from typing import TYPE_CHECKING, Literal, cast
+from typing import TYPE_CHECKING, Literal
 
 import discord
 from discord import app_commands
 from discord.ext import commands
-from pdf2image.pdf2image import convert_from_bytes
 
 from core.utils import BraceMessage as __
 
-from . import colloscope_maker as cm
+from . import colloscope_image as ci, colloscope_maker as cm
+from .render_cache import RenderCache
+from .worker_pool import WorkerPool
 
 if TYPE_CHECKING:
     from bot import MP2IBot
@@ -22,6 +24,8 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+RENDER_CACHE_PATH = "./data/colloscope_cache"
+
 
 class PlanningHelper(
     commands.GroupCog, group_name="colloscope", group_description="Un utilitaire pour gérer le colloscope"
@@ -29,6 +33,20 @@ class PlanningHelper(
     def __init__(self, bot: MP2IBot):
         self.bot = bot
         self.colloscopes: dict[str, cm.Colloscope]
+        self.render_cache = RenderCache(
+            max_size=bot.config.colloscope_cache_size,
+            spill_path=RENDER_CACHE_PATH if bot.config.colloscope_cache_on_disk else None,
+        )
+        self.workers = WorkerPool(
+            kind=bot.config.colloscope_workers_kind,
+            max_workers=bot.config.colloscope_workers,
+            max_pending=bot.config.colloscope_max_pending_renders,
+            initializer=cm.get_pdf_template,  # load the fonts in the workers processes
+        )
+        cm.get_pdf_template()
+
+        # the exported files, by class, group, colloscope checksum and format
+        self.exports: dict[tuple[str, str, str, str], bytes] = {}
 
         self.load_colloscope()
 
@@ -39,43 +57,57 @@ class PlanningHelper(
         decorator()(self.export)
         decorator()(self.next_colle)
 
+    async def cog_unload(self) -> None:
+        self.workers.shutdown()
+
     def load_colloscope(self):
         self.colloscopes = {}
         for csv_file in glob("./external_data/colloscopes/*.csv"):
             class_ = os.path.splitext(os.path.basename(csv_file))[0]
             if class_ == "example":
                 continue
+            start = time.perf_counter()
             try:
                 self.colloscopes[class_.lower()] = cm.Colloscope.from_filename(csv_file)
             except Exception as e:
                 logger.warning(
                     __("Error while reading the colloscope from : {filename}", filename=csv_file), exc_info=e
                 )
+            else:
+                logger.info(
+                    __(
+                        "Colloscope {filename} parsed in {duration:.1f}ms.",
+                        filename=csv_file,
+                        duration=(time.perf_counter() - start) * 1000,
+                    )
+                )
+
+        # the previews rendered from a previous version of the colloscopes are outdated
+        self.render_cache.clear()
+        self.exports.clear()
+        self.render_cache.purge({c.checksum for c in self.colloscopes.values()})
 
     @app_commands.command(name="aperçu", description="Affiche l'aperçu du colloscope")
     @app_commands.rename(class_="classe", group="groupe")
     @app_commands.describe(class_="Votre classe.", group="Votre groupe de colle.")
     async def quicklook(self, inter: discord.Interaction, class_: str, group: str):
         colloscope = self.colloscopes[class_]
-        colles = cm.sort_colles(colloscope.colles, sort_type="temps")  # sort by time
-
-        filtered_colles = [c for c in colles if c.group == str(group)]
+        filtered_colles = colloscope.get_group_colles(str(group))
         if not filtered_colles:
             raise ValueError("Aucune colle n'a été trouvé pour ce groupe")
 
-        buffer = io.BytesIO()
-        cm.write_colles(buffer, "pdf", filtered_colles, str(group), colloscope.holidays)
-        buffer.seek(0)
-        images = convert_from_bytes(buffer.read())
+        key = (class_, str(group), colloscope.checksum)
+        pages = await self.render_cache.get(key)
+        if pages is None:
+            await inter.response.defer()
+            pages = await self.workers.run(ci.draw_colles, filtered_colles, str(group), colloscope.holidays)
+            await self.render_cache.set(key, pages)
 
-        files: list[discord.File] = []
-        for i, img in enumerate(images):
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format="png")
-            img_buffer.seek(0)
-            files.append(discord.File(img_buffer, f"{i}.png"))
-
-        await inter.response.send_message(files=files)
+        files = [discord.File(io.BytesIO(page), f"{i}.png") for i, page in enumerate(pages)]
+        if inter.response.is_done():
+            await inter.followup.send(files=files)
+        else:
+            await inter.response.send_message(files=files)
 
     @app_commands.command(name="export", description="Exporte le colloscope dans un fichier")
     @app_commands.rename(class_="classe", group="groupe")
@@ -91,24 +123,23 @@ class PlanningHelper(
     ):
         colloscope = self.colloscopes[class_]
 
-        colles = cm.sort_colles(colloscope.colles, sort_type="temps")  # sort by time
-        filtered_colles = [c for c in colles if c.group == str(group)]
+        filtered_colles = colloscope.get_group_colles(str(group))
         if not filtered_colles:
             raise ValueError("Aucune colle n'a été trouvé pour ce groupe")
 
-        if format in ["agenda", "csv", "todoist"]:
-            format = cast(Literal["agenda", "csv", "todoist"], format)
-            buffer = io.StringIO()
-            cm.write_colles(buffer, format, filtered_colles, str(group), colloscope.holidays)
-            buffer = io.BytesIO(buffer.getvalue().encode())
-            format = "csv"
+        key = (class_, str(group), colloscope.checksum, format)
+        content = self.exports.get(key)
+        if content is None:
+            await inter.response.defer()
+            content = await self.workers.run(cm.export_colles, format, filtered_colles, str(group), colloscope.holidays)
+            self.exports[key] = content
+
+        extension = "pdf" if format == "pdf" else "csv"
+        file = discord.File(io.BytesIO(content), filename=f"colloscope.{extension}")
+        if inter.response.is_done():
+            await inter.followup.send(file=file)
         else:
-            format = cast(Literal["pdf"], format)
-            buffer = io.BytesIO()
-            cm.write_colles(buffer, format, filtered_colles, str(group), colloscope.holidays)
-        buffer.seek(0)
-        file = discord.File(buffer, filename=f"colloscope.{format}")
-        await inter.response.send_message(file=file)
+            await inter.response.send_message(file=file)
 
     @app_commands.command(name="prochaine_colle", description="Affiche la prochaine colle")
     @app_commands.rename(class_="classe", group="groupe", nb="nombre")
@@ -116,7 +147,7 @@ class PlanningHelper(
     async def next_colle(self, inter: discord.Interaction, class_: str, group: str, nb: int = 5):
         colloscope = self.colloscopes[class_]
 
-        sorted_colles = cm.get_group_upcoming_colles(colloscope.colles, str(group))
+        sorted_colles = colloscope.get_group_upcoming_colles(str(group))
         output_text = f"### __Liste des {min(nb, len(sorted_colles), 12 )} prochaines Colles du groupe {group} :__\n"
 
         for i in range(min(nb, len(sorted_colles), 12)):
@@ -133,8 +164,7 @@ class PlanningHelper(
 
         return [
             app_commands.Choice(name=g, value=g)
-            for g in sorted(self.colloscopes[inter.namespace.classe].groups)
-            if g.startswith(current)
+            for g in self.colloscopes[inter.namespace.classe].search_groups(current)
         ]
 
 
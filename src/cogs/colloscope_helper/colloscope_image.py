@@ -0,0 +1,118 @@
+"""
+Draw the colloscope table directly as PNG images, with Pillow.
+
+This reproduces the layout of the PDF export from `colloscope_maker.write_colles`, without having to lay out a PDF and
+rasterize it with poppler afterward. All the dimensions bellow are the ones used by fpdf, in millimeters.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import io
+from functools import cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .colloscope_maker import ColleData
+
+FONT_PATHS = {
+    "": "./resources/fonts/arial.ttf",
+    "B": "./resources/fonts/arial_bold.ttf",
+}
+
+DPI = 200  # the default resolution used by pdf2image
+
+PAGE_WIDTH, PAGE_HEIGHT = 210, 297
+MARGIN = 10
+BOTTOM_MARGIN = 20
+LINE_WIDTH = 0.2
+
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+COL_WIDTH = CONTENT_WIDTH / 4
+COLUMNS_WIDTHS = (10, 40, 20, COL_WIDTH * 0.75, 30, COL_WIDTH)
+ROW_HEIGHT = 11 * 25.4 / 72 + 2  # the font size (in mm) + 2
+
+
+def px(mm: float) -> int:
+    """Convert millimeters to pixels."""
+    return round(mm * DPI / 25.4)
+
+
+@cache
+def get_font(style: str, size: int) -> ImageFont.FreeTypeFont:
+    """Get a font, with a size in points."""
+    return ImageFont.truetype(FONT_PATHS[style], round(size * DPI / 72))
+
+
+class _PagesDrawer:
+    def __init__(self):
+        self.pages: list[Image.Image] = []
+        self.y: float = MARGIN
+        self.add_page()
+
+    def add_page(self) -> None:
+        self.page = Image.new("L", (px(PAGE_WIDTH), px(PAGE_HEIGHT)), 255)
+        self.draw = ImageDraw.Draw(self.page)
+        self.pages.append(self.page)
+        self.y = MARGIN
+
+    def ensure_space(self, height: float) -> None:
+        if self.y + height > PAGE_HEIGHT - BOTTOM_MARGIN:
+            self.add_page()
+
+    def text(self, x: float, width: float, height: float, text: str, font: ImageFont.FreeTypeFont) -> None:
+        self.draw.text((px(x + width / 2), px(self.y + height / 2)), text, fill=0, font=font, anchor="mm")
+
+    def row(self, cells: tuple[str, ...], fonts: tuple[ImageFont.FreeTypeFont, ...]) -> None:
+        self.ensure_space(ROW_HEIGHT)
+        x = MARGIN
+        for text, font, width in zip(cells, fonts, COLUMNS_WIDTHS, strict=True):
+            self.draw.rectangle(
+                (px(x), px(self.y), px(x + width), px(self.y + ROW_HEIGHT)), outline=0, width=px(LINE_WIDTH)
+            )
+            self.text(x, width, ROW_HEIGHT, text, font)
+            x += width
+        self.y += ROW_HEIGHT
+
+    def title(self, text: str) -> None:
+        font = get_font("", 14)
+        center = px(MARGIN + CONTENT_WIDTH / 2), px(self.y)
+        self.draw.text(center, text, fill=0, font=font, anchor="mm")
+
+        left, _, right, bottom = self.draw.textbbox(center, text, font=font, anchor="mm")
+        self.draw.line((left, bottom + px(0.5), right, bottom + px(0.5)), fill=0, width=px(LINE_WIDTH))
+
+    def export(self) -> list[bytes]:
+        result: list[bytes] = []
+        for page in self.pages:
+            buffer = io.BytesIO()
+            page.save(buffer, format="png", dpi=(DPI, DPI))
+            result.append(buffer.getvalue())
+        return result
+
+
+def draw_colles(colles_datas: list[ColleData], group: str, holidays: list[dt.date]) -> list[bytes]:
+    """Draw the colles of a group as a list of PNG pages, the same way they are written in the PDF export."""
+    regular, bold, small = get_font("", 11), get_font("B", 11), get_font("", 9)
+
+    drawer = _PagesDrawer()
+    drawer.title(f"Colloscope groupe {group}")
+    drawer.y += 11
+
+    drawer.row(("Id", "Date", "Heure", "Prof", "Salle", "Matiere"), (bold,) * 6)
+
+    vacance_index = 0
+    for i, colle in enumerate(colles_datas, 1):
+        if vacance_index < len(holidays) and colle.date > holidays[vacance_index]:
+            drawer.y += ROW_HEIGHT * 0.5
+            drawer.ensure_space(ROW_HEIGHT)
+            drawer.text(MARGIN, 90 + 2 * COL_WIDTH, ROW_HEIGHT, "Vacances", get_font("B", 14))
+            drawer.y += ROW_HEIGHT * 1.5
+            vacance_index += 1
+
+        drawer.row(
+            (str(i), colle.long_str_date, colle.str_time, colle.professor, colle.classroom, colle.subject),
+            (regular, small, regular, regular, regular, regular),
+        )
+
+    return drawer.export()
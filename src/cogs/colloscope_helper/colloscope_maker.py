@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import contextlib
+import copy
 import csv
 import datetime as dt
+import hashlib
+import io
 import operator
-import os
-from dataclasses import dataclass
+import sys
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from functools import cache
+from itertools import islice
 from typing import IO, Any, Literal, Self, cast, overload
 
 from fpdf import FPDF
@@ -14,16 +21,55 @@ from fpdf import FPDF
 class Colloscope:
     colles: list[ColleData]
     holidays: list[dt.date]
+    checksum: str = ""  # a hash of the source file, to know if something rendered from it is outdated
+
+    # per-group colles sorted by date, and the matching dates to use bisect on.
+    _group_colles: dict[str, list[ColleData]] = field(init=False, repr=False)
+    _group_dates: dict[str, list[dt.date]] = field(init=False, repr=False)
+    _groups: list[str] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._group_colles = {}
+        for colle in sort_colles(self.colles, sort_type="temps"):
+            self._group_colles.setdefault(colle.group, []).append(colle)
+        self._group_dates = {group: [c.date for c in colles] for group, colles in self._group_colles.items()}
+        self._groups = sorted(self._group_colles)
 
     @property
     def groups(self) -> list[str]:
-        """Get a unique list of available groups"""
-        return list({c.group for c in self.colles})
+        """Get a sorted unique list of available groups. The returned list must not be modified."""
+        return self._groups
+
+    def search_groups(self, prefix: str, limit: int = 25) -> list[str]:
+        """Get the first groups (sorted) starting with `prefix`."""
+        result: list[str] = []
+        for group in islice(self._groups, bisect_left(self._groups, prefix), None):
+            if not group.startswith(prefix) or len(result) >= limit:
+                break
+            result.append(group)
+        return result
+
+    def get_group_colles(self, group: str) -> list[ColleData]:
+        """Get the colles of a group, sorted by date. The returned list must not be modified."""
+        return self._group_colles.get(group, [])
+
+    def get_group_upcoming_colles(self, group: str, since: dt.date | None = None) -> list[ColleData]:
+        """Get the colles of a group happening from `since` (today by default), sorted by date."""
+        if since is None:
+            since = dt.date.today()
+        dates = self._group_dates.get(group, [])
+        return self.get_group_colles(group)[bisect_left(dates, since) :]
 
     @classmethod
     def from_filename(cls, filename: str) -> Self:
+        """Returns the colloscope by reading a csv file. See `from_csv`."""
+        with open(filename, "rb") as f:
+            return cls.from_csv(f.read())
+
+    @classmethod
+    def from_csv(cls, content: bytes) -> Self:
         """
-        Returns a list of all the collesDatas by reading a csv file.
+        Returns the colloscope from the content of a csv file.
 
         The csv file must follow the next syntaxe:
         ```csv
@@ -36,47 +82,55 @@ class Colloscope:
         The numbers behind the classroom are the groups identifiers. They will be handled as string, as they can be anything in practice
         """
         colles: list[ColleData] = []
+        holidays: list[dt.date] = []
+
+        checksum = hashlib.sha256(content).hexdigest()
 
-        with open(filename, encoding="utf-8", errors="ignore") as f:
-            csv_reader = csv.reader(f, delimiter=",")
-
-            holidays: list[dt.date] = []
-            header = next(csv_reader)
-
-            """
-            | headers
-            | colle slot 1
-            | colle slot 2
-            | ...
-            v
-            """
-            for row in csv_reader:
-                # subject,professor,weekday,hour,classroom,[groups...]
-                subject, professor, week_day, raw_hour, classroom = row[0:5]
-                raw_hour, raw_minute = raw_hour.split("h")  # raw hour pattern: xxhyy
-                hour: dt.time = dt.time(hour=int(raw_hour), minute=int(raw_minute) if raw_minute else 0)
-
-                for x in range(5, len(row)):
-                    # [5],group,group,group,...
-                    group = row[x]
-                    if group != "":
-                        # we parse the date here, to avoid the "Vacances" case.
-                        week = dt.datetime.strptime(header[x], "%d/%m/%y").date()
-                        date: dt.date = day_offset(week, week_day)
-                        colles.append(ColleData(group, subject, professor, date, week_day, hour, classroom))
-
-        for i, week in enumerate(header):
-            if week.lower() == "vacances":
-                if not header[i - 1]:
+        csv_reader = csv.reader(io.StringIO(content.decode("utf-8", errors="ignore")), delimiter=",")
+        header = next(csv_reader)
+
+        # parse every week of the header once. The columns that are not dates (like "Vacances") are None.
+        weeks: list[dt.date | None] = [None] * len(header)
+        for x in range(5, len(header)):
+            if header[x].lower() == "vacances":
+                if (previous_week := weeks[x - 1]) is not None:
+                    holidays.append(previous_week + dt.timedelta(days=7))
+                continue
+            with contextlib.suppress(ValueError):
+                weeks[x] = dt.datetime.strptime(header[x], "%d/%m/%y").date()
+
+        """
+        | headers
+        | colle slot 1
+        | colle slot 2
+        | ...
+        v
+        """
+        for row in csv_reader:
+            # subject,professor,weekday,hour,classroom,[groups...]
+            subject, professor, week_day, raw_hour, classroom = row[0:5]
+            raw_hour, raw_minute = raw_hour.split("h")  # raw hour pattern: xxhyy
+            hour: dt.time = dt.time(hour=int(raw_hour), minute=int(raw_minute) if raw_minute else 0)
+            offset = WEEK_DAYS_OFFSETS[week_day.lower()]
+
+            for x in range(5, len(row)):
+                # [5],group,group,group,...
+                group = row[x]
+                if group == "":
                     continue
-                week = dt.datetime.strptime(header[i - 1], "%d/%m/%y").date()
-                holidays.append(week + dt.timedelta(days=7))
+                week = weeks[x] if x < len(weeks) else None
+                if week is None:
+                    raise ValueError(f"The column {x + 1} has groups, but no valid date in the header.")
+                colles.append(ColleData(group, subject, professor, week + offset, week_day, hour, classroom))
 
-        return cls(colles, holidays)
+        return cls(colles, holidays, checksum)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ColleData:
+    """A single colle. The instances are kept in memory for all the classes, so they are made as light as possible:
+    the repeated strings are interned, and the formatted dates are shared between the colles."""
+
     group: str
     subject: str
     professor: str
@@ -86,18 +140,20 @@ class ColleData:
     classroom: str
 
     def __post_init__(self):
-        self.week_day = self.week_day.lower()
+        for name in ("group", "subject", "professor", "classroom"):
+            object.__setattr__(self, name, sys.intern(getattr(self, name)))
+        object.__setattr__(self, "week_day", sys.intern(self.week_day.lower()))
 
     def __str__(self):
         return f"Le {self.str_date}, passe le groupe {self.group} en {self.classroom} avec {self.professor} à {self.str_time}"
 
     @property
     def str_date(self) -> str:
-        return self.date.strftime("%d/%m/%Y")
+        return _format_date(self.date)
 
     @property
     def str_time(self) -> str:
-        return self.time.strftime("%Hh%M")
+        return _format_time(self.time)
 
     @property
     def long_str_date(self) -> str:
@@ -105,29 +161,48 @@ class ColleData:
         Return the date in a human readable format :
         Ex: "Lundi 10 janvier"
         """
-        month_name = [
-            "janvier",
-            "février",
-            "mars",
-            "avril",
-            "mai",
-            "juin",
-            "juillet",
-            "août",
-            "septembre",
-            "octobre",
-            "novembre",
-            "décembre",
-        ]
+        return _format_long_date(self.week_day, self.date)
 
-        return f"{self.week_day} {self.date.day} {month_name[self.date.month - 1]}"
 
+MONTHS_NAMES = [
+    "janvier",
+    "février",
+    "mars",
+    "avril",
+    "mai",
+    "juin",
+    "juillet",
+    "août",
+    "septembre",
+    "octobre",
+    "novembre",
+    "décembre",
+]
+
+
+@cache
+def _format_date(date: dt.date) -> str:
+    return date.strftime("%d/%m/%Y")
+
+
+@cache
+def _format_time(time: dt.time) -> str:
+    return time.strftime("%Hh%M")
+
+
+@cache
+def _format_long_date(week_day: str, date: dt.date) -> str:
+    return f"{week_day} {date.day} {MONTHS_NAMES[date.month - 1]}"
+
+
+WEEK_DAYS_OFFSETS = {
+    week_day: dt.timedelta(days=i)
+    for i, week_day in enumerate(["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi"])
+}
 
-def day_offset(week: dt.date, week_day: str) -> dt.date:
-    week_days = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi"]
 
-    delta = dt.timedelta(days=week_days.index(week_day.lower()))
-    return week + delta
+def day_offset(week: dt.date, week_day: str) -> dt.date:
+    return week + WEEK_DAYS_OFFSETS[week_day.lower()]
 
 
 def sort_colles(
@@ -147,6 +222,63 @@ def add_one_hour(time: dt.time) -> str:
     return agenda_format_time(dt.time(hour=time.hour + 1, minute=time.minute))
 
 
+class PDFTemplate:
+    """A PDF document with the fonts loaded and the table header drawn.
+
+    Loading the fonts is the most expensive part of the PDF export, so the template is built once, and each export
+    works on a copy of it.
+    """
+
+    def __init__(self):
+        pdf = FPDF()
+        pdf.add_font("Arial", "", "./resources/fonts/arial.ttf")
+        pdf.add_font("Arial", "B", "./resources/fonts/arial_bold.ttf")
+        pdf.add_page()
+        page_width = pdf.w - 2 * pdf.l_margin
+
+        # leave space for the title, added by new_document()
+        pdf.ln(10)
+
+        pdf.set_font("Arial", "", 11)
+
+        self.col_width = col_width = page_width / 4
+
+        pdf.ln(1)
+
+        self.row_height = th = pdf.font_size + 2
+
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(10, th, text="Id", border=1, align="C")  # type: ignore
+        pdf.cell(40, th, "Date", border=1, align="C")
+        pdf.cell(20, th, "Heure", border=1, align="C")
+        pdf.cell(col_width * 0.75, th, "Prof", border=1, align="C")
+        pdf.cell(30, th, "Salle", border=1, align="C")
+        pdf.cell(col_width, th, "Matiere", border=1, align="C")
+        pdf.set_font("Arial", "", 11)
+        pdf.ln(th)
+
+        self.page_width = page_width
+        self.table_y = pdf.y
+        self._pdf = pdf
+
+    def new_document(self, group: str) -> FPDF:
+        """Get a copy of the template, with the title of the group, ready to receive the rows."""
+        pdf = copy.deepcopy(self._pdf)
+
+        pdf.set_xy(pdf.l_margin, pdf.t_margin)
+        pdf.set_font("Arial", "U", 14)
+        pdf.cell(self.page_width, 0.0, f"Colloscope groupe {group}", align="C")
+
+        pdf.set_xy(pdf.l_margin, self.table_y)
+        pdf.set_font("Arial", "", 11)
+        return pdf
+
+
+@cache
+def get_pdf_template() -> PDFTemplate:
+    return PDFTemplate()
+
+
 @overload
 def write_colles(
     file: IO[str],
@@ -174,11 +306,6 @@ def write_colles(
     group: str,
     holidays: list[dt.date],
 ):
-    export_path = f"./groupe{group}"
-
-    if not os.path.exists(export_path):
-        os.mkdir(export_path)
-
     def csv_method(f: IO[str]):
         # write the sorted data into a csv file
         writer = csv.writer(f, delimiter=",")
@@ -257,33 +384,9 @@ def write_colles(
 
     def pdf_method(f: IO[bytes]):
         vacance_index = 0
-        pdf = FPDF()
-        pdf.add_font("Arial", "", "./resources/fonts/arial.ttf")
-        pdf.add_font("Arial", "B", "./resources/fonts/arial_bold.ttf")
-        pdf.add_page()
-        page_width = pdf.w - 2 * pdf.l_margin
-
-        pdf.set_font("Arial", "U", 14)
-        pdf.cell(page_width, 0.0, f"Colloscope groupe {group}", align="C")
-        pdf.ln(10)
-
-        pdf.set_font("Arial", "", 11)
-
-        col_width = page_width / 4
-
-        pdf.ln(1)
-
-        th = pdf.font_size + 2
-
-        pdf.set_font("Arial", "B", 11)
-        pdf.cell(10, th, text="Id", border=1, align="C")  # type: ignore
-        pdf.cell(40, th, "Date", border=1, align="C")
-        pdf.cell(20, th, "Heure", border=1, align="C")
-        pdf.cell(col_width * 0.75, th, "Prof", border=1, align="C")
-        pdf.cell(30, th, "Salle", border=1, align="C")
-        pdf.cell(col_width, th, "Matiere", border=1, align="C")
-        pdf.set_font("Arial", "", 11)
-        pdf.ln(th)
+        template = get_pdf_template()
+        pdf = template.new_document(group)
+        col_width, th = template.col_width, template.row_height
 
         for i, colle in enumerate(colles_datas, 1):
             if vacance_index < len(holidays) and colle.date > holidays[vacance_index]:
@@ -323,7 +426,18 @@ def write_colles(
             return todoist_method(file)
 
 
-def get_group_upcoming_colles(colles: list[ColleData], group: str) -> list[ColleData]:
-    colles = sort_colles(colles, sort_type="temps")  # sort by time
-    filtered_colles = [c for c in colles if c.group == group and c.date >= dt.date.today()]
-    return filtered_colles
+def export_colles(
+    export_type: Literal["pdf", "csv", "agenda", "todoist"],
+    colles_datas: list[ColleData],
+    group: str,
+    holidays: list[dt.date],
+) -> bytes:
+    """Same as `write_colles`, but return the content of the file instead."""
+    if export_type == "pdf":
+        buffer = io.BytesIO()
+        write_colles(buffer, export_type, colles_datas, group, holidays)
+        return buffer.getvalue()
+
+    text_buffer = io.StringIO()
+    write_colles(text_buffer, export_type, colles_datas, group, holidays)
+    return text_buffer.getvalue().encode()
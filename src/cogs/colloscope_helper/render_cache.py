@@ -0,0 +1,111 @@
+"""
+A small LRU cache for the rendered colloscope previews.
+
+The previews only change when the colloscope CSV changes, so they are keyed by class, group and a hash of the CSV.
+Entries evicted from memory can be spilled to the disk, to be served later without rendering them again. The disk is
+accessed in a thread, to not block the event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from glob import glob
+
+from core.utils import BraceMessage as __
+
+logger = logging.getLogger(__name__)
+
+CacheKey = tuple[str, str, str]  # class, group, colloscope checksum
+
+
+class RenderCache:
+    """Keep the last rendered PNG pages in memory, and optionally on the disk.
+
+    Args:
+        max_size: the maximum number of entries kept in memory.
+        spill_path: a directory where evicted entries are written. If None, evicted entries are simply dropped.
+    """
+
+    def __init__(self, max_size: int = 64, spill_path: str | None = None):
+        self._internal: OrderedDict[CacheKey, list[bytes]] = OrderedDict()
+        self._max_size = max_size
+        self._spill_path = spill_path
+        self._spilling: dict[CacheKey, list[bytes]] = {}  # the entries being written, not readable from the disk yet
+
+        if spill_path is not None:
+            os.makedirs(spill_path, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._internal)
+
+    async def get(self, key: CacheKey) -> list[bytes] | None:
+        if key in self._internal:
+            self._internal.move_to_end(key)
+            return self._internal[key]
+
+        pages = self._spilling.get(key)
+        if pages is None and self._spill_path is not None:
+            pages = await asyncio.to_thread(self._read_spilled, key)
+        if pages is not None:
+            await self.set(key, pages)
+        return pages
+
+    async def set(self, key: CacheKey, pages: list[bytes]) -> None:
+        self._internal[key] = pages
+        self._internal.move_to_end(key)
+        while len(self._internal) > self._max_size:
+            evicted_key, evicted_pages = self._internal.popitem(last=False)
+            await self._spill(evicted_key, evicted_pages)
+
+    def clear(self) -> None:
+        self._internal.clear()
+
+    def purge(self, checksums: set[str]) -> None:
+        """Remove the spilled entries that doesn't belong to any of the given colloscope checksums."""
+        if self._spill_path is None:
+            return
+
+        for file in glob(os.path.join(self._spill_path, "*.png")):
+            checksum = os.path.basename(file).split("-", 1)[0]
+            if checksum not in checksums:
+                os.remove(file)
+
+    def _stem(self, key: CacheKey) -> str:
+        class_, group, checksum = key
+        # groups can be anything, so we hash them to get a safe filename
+        digest = hashlib.sha1(f"{class_}/{group}".encode(), usedforsecurity=False).hexdigest()
+        return os.path.join(self._spill_path or "", f"{checksum}-{digest}")
+
+    async def _spill(self, key: CacheKey, pages: list[bytes]) -> None:
+        if self._spill_path is None:
+            return
+
+        self._spilling[key] = pages
+        try:
+            await asyncio.to_thread(self._write_spilled, key, pages)
+        finally:
+            self._spilling.pop(key, None)
+
+    def _write_spilled(self, key: CacheKey, pages: list[bytes]) -> None:
+        stem = self._stem(key)
+        try:
+            for i, page in enumerate(pages):
+                with open(f"{stem}_{i}.png", "wb") as f:
+                    f.write(page)
+        except OSError as e:
+            logger.warning(__("Could not write the rendered colloscope {} to the disk.", stem), exc_info=e)
+
+    def _read_spilled(self, key: CacheKey) -> list[bytes] | None:
+        files = glob(f"{self._stem(key)}_*.png")
+        if not files:
+            return None
+
+        pages: list[bytes] = []
+        for file in sorted(files, key=lambda f: int(os.path.splitext(f)[0].rsplit("_", 1)[1])):
+            with open(file, "rb") as f:
+                pages.append(f.read())
+        return pages
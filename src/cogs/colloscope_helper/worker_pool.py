@@ -0,0 +1,64 @@
+"""
+Run the blocking renderers (fpdf, Pillow) outside of the event loop.
+
+The rendering of a colloscope can take a few hundred milliseconds. Running it inside a coroutine would block the whole
+bot (gateway heartbeats, other commands...) in the meantime.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Literal, TypeVar
+
+from core.errors import BaseError
+
+T = TypeVar("T")
+
+
+class WorkerPool:
+    """A pool of workers, with a bounded number of pending jobs.
+
+    Args:
+        kind: use threads or processes. Processes avoid any contention with the event loop (GIL), but the functions
+            and their arguments must be picklable.
+        max_workers: the number of workers.
+        max_pending: the maximum number of jobs waiting or running. Further jobs are rejected with a BaseError.
+        initializer: a function called by each worker when it starts.
+    """
+
+    def __init__(
+        self,
+        kind: Literal["thread", "process"] = "thread",
+        max_workers: int = 2,
+        max_pending: int = 16,
+        initializer: Callable[[], Any] | None = None,
+    ):
+        self._executor: Executor
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="colloscope-render", initializer=initializer
+            )
+        self._max_pending = max_pending
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._pending >= self._max_pending:
+            raise BaseError("Trop de demandes en cours, réessaye dans quelques instants.")
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
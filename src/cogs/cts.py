@@ -4,70 +4,306 @@ Everything related to the CTS API & commands.
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
-from dataclasses import dataclass
-from datetime import datetime
-from typing import TYPE_CHECKING, Literal, NamedTuple
+import unicodedata
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, time, timedelta
+from os import path
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, TypedDict
+from zoneinfo import ZoneInfo
 
 import discord
 
 # import humanize
 from discord import app_commands
+from discord.ext import tasks
 from discord.ext.commands import Cog  # pyright: ignore[reportMissingTypeStubs]
 from discord.utils import get
 
 from core.errors import BaseError
-from core.utils import ResponseType, response_constructor
-from libraries.cts import get_lines, get_stop_times, get_stops
+from core.utils import BraceMessage as __, ResponseType, response_constructor
+from libraries.cts import STOP_TIMES_TTL, get_lines, get_stop_times, get_stops
 
 if TYPE_CHECKING:
     from discord import Embed, Emoji, Interaction
+    from discord.types.embed import Embed as EmbedData
 
     from bot import MP2IBot
+    from libraries.cts.decoding import StopTime
+    from libraries.cts.models import ResponseLinesDiscoveryList, ResponseStopPointsDiscoveryList
 
 
 logger = logging.getLogger(__name__)
 
+DISCOVERY_CACHE_PATH = "./data/cts_discovery.json"
+DISCOVERY_MAX_AGE = timedelta(days=1)
+DISCOVERY_CHECK_INTERVAL = 60 * 60  # in seconds, how often the validity of the stops and lines is checked
+DISCOVERY_RETRY_MIN = 30  # in seconds, the first delay before retrying a failed refresh, then doubled
+DISCOVERY_RETRY_MAX = 30 * 60  # in seconds
+
+# in seconds
+HOT_STOPS_INTERVAL = 120
+HOT_STOPS_PEAK_INTERVAL = STOP_TIMES_TTL  # around the end of the classes
+HOT_STOPS_NIGHT_INTERVAL = 15 * 60  # nothing is fetched, we just wait for the morning
+HOT_STOPS_MAX_AGE = STOP_TIMES_TTL  # as fresh as the times of any other stop, older ones are fetched again
+
+BOARD_INTERVAL = 30  # in seconds, the stop times are cached as long by libraries.cts
+BOARD_LIFETIME = 2 * 60 * 60  # in seconds
+MAX_BOARDS_MESSAGES = 20
+
+
+class DiscoveryCache(TypedDict):
+    stops: ResponseStopPointsDiscoveryList
+    lines: ResponseLinesDiscoveryList
+
 
 @dataclass
 class Stop:
     name: str
-    ref: str
+    ref: str  # the LogicalStopCode, shared by all the directions of the stop
+    lines: set[str] = field(default_factory=set[str])
+    location: tuple[float, float] | None = None  # longitude, latitude
+
+
+def normalize(text: str) -> str:
+    """Lowercase the text, remove the accents and replace the punctuation with spaces."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c if c.isalnum() else " " for c in decomposed if not unicodedata.combining(c))
+
+
+def trigrams(token: str) -> set[str]:
+    return {token[i : i + 3] for i in range(len(token) - 2)}
+
+
+class StopsIndex:
+    """A search index over the stops names, insensitive to case and accents.
+
+    A query matches a stop if each word of the query is the beginning of a word of the stop name (so "homme fer"
+    matches "Homme de Fer"). The stops whose name starts with the query come first. If there are not enough results,
+    the stops sharing the most trigrams with the query are added (to find "Kléber" from "leber").
+    """
+
+    def __init__(self, stops: list[Stop]):
+        self.stops = sorted(stops, key=lambda s: s.name)
+        self._names = [normalize(stop.name) for stop in self.stops]
+
+        words: dict[str, set[int]] = {}
+        self._trigrams: dict[str, set[int]] = {}
+        for i, name in enumerate(self._names):
+            for word in name.split():
+                words.setdefault(word, set()).add(i)
+                for trigram in trigrams(word):
+                    self._trigrams.setdefault(trigram, set()).add(i)
+
+        self._words = sorted(words)
+        self._words_stops = [words[w] for w in self._words]
+
+    def _prefixed(self, prefix: str) -> set[int]:
+        """Get the stops having a word starting with prefix."""
+        result: set[int] = set()
+        for i in range(bisect_left(self._words, prefix), len(self._words)):
+            if not self._words[i].startswith(prefix):
+                break
+            result |= self._words_stops[i]
+        return result
+
+    def search(self, query: str, limit: int = 25) -> list[Stop]:
+        normalized = normalize(query)
+        words = normalized.split()
+        if not words:
+            return self.stops[:limit]
+
+        matches = set.intersection(*(self._prefixed(word) for word in words))
+        normalized = " ".join(words)
+        ranked = sorted(matches, key=lambda i: (not self._names[i].startswith(normalized), len(self._names[i]), i))
+
+        if len(ranked) < limit:
+            query_trigrams = set().union(*(trigrams(word) for word in words))
+            scores: dict[int, int] = {}
+            for trigram in query_trigrams:
+                for i in self._trigrams.get(trigram, ()):
+                    if i not in matches:
+                        scores[i] = scores.get(i, 0) + 1
+            # at least half of the trigrams must match, to avoid irrelevant results
+            threshold = (len(query_trigrams) + 1) // 2
+            fuzzy = sorted((i for i, score in scores.items() if score >= threshold), key=lambda i: (-scores[i], i))
+            ranked.extend(fuzzy)
+
+        return [self.stops[i] for i in ranked[:limit]]
 
-    def __eq__(self, other: object) -> bool:
-        return isinstance(other, Stop) and self.name == other.name and self.ref == other.ref
 
+@dataclass
+class BoardMessage:
+    message: discord.Message
+    expires_at: float  # monotonic time
+    rendered: list[EmbedData] | None = None  # the embeds currently displayed
+
+
+@dataclass
+class Board:
+    """The live departures messages of a stop. They are all refreshed by a single task."""
 
-class StopTime(NamedTuple):
-    type: Literal["bus", "tram"]
-    destination: str
-    line: str
-    arrival: datetime
+    stop: Stop
+    messages: list[BoardMessage] = field(default_factory=list[BoardMessage])
+    task: asyncio.Task[None] | None = None
 
 
 class CTS(Cog):
     def __init__(self, bot: MP2IBot):
         self.bot = bot
         self.emojis: dict[str, Emoji] = {}
+        self.stops: dict[str, Stop] = {}  # stops by LogicalStopCode
+        self.stops_index = StopsIndex([])
+        self.discovery_expires_at: datetime | None = None  # when the stops and lines should be fetched again
+        self.discovery_retry_delay = DISCOVERY_RETRY_MIN
+        # the prefetched times of the hot stops, with the (monotonic) time they have been fetched at
+        self.hot_stops_times: dict[str, tuple[float, list[StopTime]]] = {}
+        self.boards: dict[str, Board] = {}  # boards by LogicalStopCode
 
     async def cog_load(self) -> None:
-        stops = await get_stops()
+        guild = await self.bot.fetch_guild(self.bot.config.guild_id)
+        self.guild_emojis = guild.emojis
+
+        # Serve the stops from the disk first, so the cog doesn't depend on the API to be loaded.
+        cache = self.read_discovery_cache()
+        if cache is not None:
+            self.load_stops(cache["stops"])
+            self.load_lines(cache["lines"])
+            self.discovery_expires_at = self.get_discovery_expiry(cache)
+
+        # refresh the stops and lines when they are missing or outdated, and keep retrying if the API is down
+        self.refresh_discovery_loop.start()
+
+        if self.bot.config.cts_hot_stops:
+            self.prefetch_hot_stops.start()
+
+    async def cog_unload(self) -> None:
+        self.refresh_discovery_loop.cancel()
+        self.prefetch_hot_stops.cancel()
+        for board in self.boards.values():
+            if board.task is not None:
+                board.task.cancel()
+
+    def read_discovery_cache(self) -> DiscoveryCache | None:
+        if not path.exists(DISCOVERY_CACHE_PATH):
+            return None
+        try:
+            with open(DISCOVERY_CACHE_PATH, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read the CTS discovery cache.", exc_info=e)
+            return None
+
+    @staticmethod
+    def get_discovery_expiry(cache: DiscoveryCache) -> datetime:
+        """Get the date after which the discovery responses should be fetched again.
+
+        The lines are valid until their `ValidUntil` date, the stops don't have one, so they are refreshed when they
+        are older than `DISCOVERY_MAX_AGE`.
+        """
+        try:
+            lines_valid_until = datetime.fromisoformat(cache["lines"]["LinesDelivery"]["ValidUntil"])
+            stops_timestamp = datetime.fromisoformat(cache["stops"]["StopPointsDelivery"]["ResponseTimestamp"])
+            return min(lines_valid_until, stops_timestamp + DISCOVERY_MAX_AGE)
+        except (KeyError, TypeError, ValueError):
+            return datetime.min.replace(tzinfo=UTC)
+
+    @tasks.loop(seconds=DISCOVERY_RETRY_MIN)
+    async def refresh_discovery_loop(self) -> None:
+        """Refresh the stops and lines once they expire, with an exponential backoff while the API fails."""
+        now = datetime.now(UTC)
+        if self.discovery_expires_at is None or now >= self.discovery_expires_at:
+            if not await self.refresh_discovery():
+                delay = self.discovery_retry_delay
+                self.discovery_retry_delay = min(delay * 2, DISCOVERY_RETRY_MAX)
+                logger.info(__("Retrying to refresh the CTS stops and lines in {}s.", delay))
+                self.refresh_discovery_loop.change_interval(seconds=delay)
+                return
+            self.discovery_retry_delay = DISCOVERY_RETRY_MIN
+
+        delay = DISCOVERY_CHECK_INTERVAL
+        if self.discovery_expires_at is not None:
+            remaining = (self.discovery_expires_at - datetime.now(UTC)).total_seconds()
+            if remaining > 0:  # the API could also return outdated data, then just check again later
+                delay = min(remaining, DISCOVERY_CHECK_INTERVAL)
+        self.refresh_discovery_loop.change_interval(seconds=delay)
+
+    async def refresh_discovery(self) -> bool:
+        """Get the stops and lines from the API, and store them on the disk for the next loads.
+
+        Returns:
+            Whether the stops and lines have been refreshed.
+        """
+        try:
+            stops = await get_stops()
+            lines = await get_lines()
+        except BaseError as e:
+            logger.warning(__("Could not refresh the CTS stops and lines: {}", e))
+            return False
+        except Exception:
+            logger.exception("Could not refresh the CTS stops and lines.")
+            return False
+
+        if stops["StopPointsDelivery"]["AnnotatedStopPointRef"] is None:
+            logger.warning("Could not find any stop stations ?")
+            return False
+
+        cache: DiscoveryCache = {"stops": stops, "lines": lines}
+        self.load_stops(stops)
+        self.load_lines(lines)
+        self.discovery_expires_at = self.get_discovery_expiry(cache)
+
+        await asyncio.to_thread(self.write_discovery_cache, cache)
+        return True
+
+    @staticmethod
+    def write_discovery_cache(cache: DiscoveryCache) -> None:
+        try:
+            with open(DISCOVERY_CACHE_PATH, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            logger.warning("Could not write the CTS discovery cache.", exc_info=e)
+
+    def load_stops(self, stops: ResponseStopPointsDiscoveryList) -> None:
         stops_list = stops["StopPointsDelivery"]["AnnotatedStopPointRef"]
         if stops_list is None:
             logger.warning("Could not find any stop stations ?")
-            raise Exception("Could not find any stop stations ?")  # noqa: TRY002 # TODO
+            return
 
-        self.stops: list[Stop] = []
+        start = perf_counter()
+        registry: dict[str, Stop] = {}
         for stop_paylod in stops_list:
-            if stop_paylod["StopName"] is None or stop_paylod["Extension"]["LogicalStopCode"] is None:
+            ref = stop_paylod["Extension"]["LogicalStopCode"]
+            if stop_paylod["StopName"] is None or ref is None:
                 continue
 
-            stop = Stop(name=stop_paylod["StopName"], ref=stop_paylod["Extension"]["LogicalStopCode"])
-            if stop in self.stops:
-                continue
-            self.stops.append(stop)
+            stop = registry.get(ref)
+            if stop is None:
+                location = stop_paylod["Location"]
+                coords = None
+                if location["Longitude"] is not None and location["Latitude"] is not None:
+                    coords = (location["Longitude"], location["Latitude"])
+                stop = registry[ref] = Stop(name=stop_paylod["StopName"], ref=ref, location=coords)
+
+            # the same stop appears once per direction, with different lines
+            stop.lines.update(line["LineRef"] for line in stop_paylod["Lines"] or () if line["LineRef"] is not None)
+
+        self.stops = registry
+        self.stops_index = StopsIndex(list(registry.values()))
+        logger.info(
+            __(
+                "{} stops registered from {} stop points in {:.1f}ms.",
+                len(registry),
+                len(stops_list),
+                (perf_counter() - start) * 1000,
+            )
+        )
 
-        lines = await get_lines()
+    def load_lines(self, lines: ResponseLinesDiscoveryList) -> None:
         lines_list = lines["LinesDelivery"]["AnnotatedLineRef"]
         if lines_list is None:
             logger.warning("Could not get any lines ?")
@@ -75,11 +311,10 @@ class CTS(Cog):
         else:
             lines_names: list[str] = [line["LineRef"] for line in lines_list if line["LineRef"] is not None]
 
-        guild = await self.bot.fetch_guild(self.bot.config.guild_id)
         for line_name in lines_names:
             if line_name in self.emojis:
                 continue
-            emoji = get(guild.emojis, name="_" + line_name)
+            emoji = get(self.guild_emojis, name="_" + line_name)
             if not emoji:
                 continue
             self.emojis[line_name] = emoji
@@ -87,43 +322,32 @@ class CTS(Cog):
     @app_commands.command()
     @app_commands.rename(stop_ref="arrêt")
     async def cts_next(self, inter: Interaction, stop_ref: str):
-        await inter.response.defer()
-        stop = get(self.stops, ref=stop_ref)
+        start = perf_counter()
+        stop = self.stops.get(stop_ref)
+        logger.debug(__("Stop {} looked up in {:.2f}µs.", stop_ref, (perf_counter() - start) * 1e6))
         if not stop:
+            if not self.stops:
+                raise BaseError("Les arrêts n'ont pas encore été chargés, réessaye dans quelques instants.")
             raise BaseError("Arrêt non trouvé !")
 
-        tmp = await get_stop_times(stop.ref)
-        tmp = tmp["ServiceDelivery"]["StopMonitoringDelivery"]
-
-        if tmp is None or not tmp:
-            raise BaseError("Quelque chose de plutôt inattendu s'est passé !")
+        # the hot stops are already in memory, no need to wait for the API
+        if (times := self.get_hot_stop_times(stop.ref)) is not None:
+            await inter.response.send_message(embeds=self.build_embeds(stop, times))
+            return
 
-        times: list[StopTime] = []
-        for tmp in tmp[0]["MonitoredStopVisit"]:
-            vehicle = tmp["MonitoredVehicleJourney"]
-
-            if vehicle["VehicleMode"] not in ("bus", "tram"):
-                continue
-
-            times.append(
-                StopTime(
-                    type=vehicle["VehicleMode"],
-                    destination=vehicle["DestinationName"] or "??",
-                    line=vehicle["LineRef"] or "??",
-                    arrival=datetime.fromisoformat(vehicle["MonitoredCall"]["ExpectedArrivalTime"]),
-                )
-            )
+        await inter.response.defer()
+        times = await get_stop_times(stop.ref)
+        await inter.edit_original_response(embeds=self.build_embeds(stop, times))
 
+    def build_embeds(self, stop: Stop, times: list[StopTime]) -> list[Embed]:
         embed = response_constructor(ResponseType.info, f"Prochaines arrivées pour {stop.name}")["embed"]
 
         embeds_data: dict[str, str] = {}
         groups: dict[tuple[str, str, str], list[int]] = {}
 
-        for time in sorted(times, key=lambda t: t.arrival):
-            groups.setdefault((time.type, time.line, time.destination), [])
-
-            ts: int = int(time.arrival.timestamp())
-            groups[(time.type, time.line, time.destination)].append(ts)
+        for stop_time in sorted(times, key=lambda t: t.arrival):
+            groups.setdefault((stop_time.type, stop_time.line, stop_time.destination), [])
+            groups[(stop_time.type, stop_time.line, stop_time.destination)].append(stop_time.arrival)
 
         for group, group_times in groups.items():
             key = group[0].capitalize()
@@ -137,16 +361,143 @@ class CTS(Cog):
         embeds: list[Embed] = [embed]
         for name, value in embeds_data.items():
             embeds.append(discord.Embed(title=name, description=value, color=embeds[0].color))
+        return embeds
+
+    def get_hot_stop_times(self, stop_ref: str) -> list[StopTime] | None:
+        """Get the times of a hot stop, if they have been prefetched recently enough."""
+        cached = self.hot_stops_times.get(stop_ref)
+        if cached is None or monotonic() - cached[0] > HOT_STOPS_MAX_AGE:
+            return None
+        return cached[1]
+
+    @tasks.loop(seconds=HOT_STOPS_INTERVAL)
+    async def prefetch_hot_stops(self) -> None:
+        """Keep the times of the configured hot stops in memory.
+
+        The interval is adapted to the time of the day: the stops are refreshed more often around the end of the
+        classes, and not at all during the night.
+        """
+        now = datetime.now(tz=ZoneInfo("Europe/Paris"))
+        interval = self.get_prefetch_interval(now)
+        if interval != self.prefetch_hot_stops.seconds:
+            self.prefetch_hot_stops.change_interval(seconds=interval)
+        if interval == HOT_STOPS_NIGHT_INTERVAL:
+            return
+
+        for stop_ref in self.bot.config.cts_hot_stops:
+            try:
+                times = await get_stop_times(stop_ref)
+            except BaseError as e:
+                logger.warning(__("Could not prefetch the hot stop {}: {}", stop_ref, e))
+                continue
+            except Exception:
+                logger.exception(__("Prefetching the hot stop {} raised an unhandled exception.", stop_ref))
+                continue
+            self.hot_stops_times[stop_ref] = (monotonic(), times)
+
+    @prefetch_hot_stops.before_loop
+    async def before_prefetch_hot_stops(self) -> None:
+        await self.bot.wait_until_ready()
+
+    def get_prefetch_interval(self, now: datetime) -> float:
+        night_start, night_end = (time.fromisoformat(t) for t in self.bot.config.cts_night)
+        current = now.time()
+        if current >= night_start or current < night_end:
+            return HOT_STOPS_NIGHT_INTERVAL
 
-        await inter.edit_original_response(embeds=embeds)
+        today = now.date()
+        for end in self.bot.config.cts_class_end_times:
+            class_end = datetime.combine(today, time.fromisoformat(end), tzinfo=now.tzinfo)
+            if timedelta(minutes=-10) <= now - class_end <= timedelta(minutes=20):
+                return HOT_STOPS_PEAK_INTERVAL
+        return HOT_STOPS_INTERVAL
 
+    @app_commands.command()
+    @app_commands.rename(stop_ref="arrêt")
+    async def cts_board(self, inter: Interaction, stop_ref: str):
+        stop = self.stops.get(stop_ref)
+        if not stop:
+            if not self.stops:
+                raise BaseError("Les arrêts n'ont pas encore été chargés, réessaye dans quelques instants.")
+            raise BaseError("Arrêt non trouvé !")
+        if not isinstance(inter.channel, discord.abc.Messageable):
+            raise BaseError("Impossible d'envoyer un tableau ici.")
+        if sum(len(board.messages) for board in self.boards.values()) >= MAX_BOARDS_MESSAGES:
+            raise BaseError("Il y a déjà trop de tableaux actifs, réutilise l'un d'eux !")
+
+        await inter.response.defer(ephemeral=True)
+        embeds = self.build_embeds(stop, await get_stop_times(stop.ref))
+        # the interaction messages can't be edited after 15 minutes, so the board is a regular message
+        message = await inter.channel.send(embeds=embeds)
+
+        board = self.boards.setdefault(stop.ref, Board(stop))
+        board.messages.append(
+            BoardMessage(message, monotonic() + BOARD_LIFETIME, rendered=[embed.to_dict() for embed in embeds])
+        )
+        if board.task is None or board.task.done():
+            board.task = asyncio.create_task(self.run_board(board))
+
+        await inter.edit_original_response(
+            embed=response_constructor(
+                ResponseType.success, f"Le tableau sera mis à jour pendant {BOARD_LIFETIME // 3600} heures."
+            )["embed"]
+        )
+
+    async def run_board(self, board: Board) -> None:
+        """Refresh all the messages of a board, with a single request per interval.
+
+        A message is only edited if its content has changed: the relative times are rendered by Discord itself.
+        """
+        try:
+            while board.messages:
+                await asyncio.sleep(BOARD_INTERVAL)
+
+                try:
+                    times = await get_stop_times(board.stop.ref)
+                except BaseError as e:
+                    logger.warning(__("Could not refresh the board of {}: {}", board.stop.ref, e))
+                    continue
+                except Exception:
+                    logger.exception(__("Refreshing the board of {} raised an unhandled exception.", board.stop.ref))
+                    continue
+
+                embeds = self.build_embeds(board.stop, times)
+                rendered = [embed.to_dict() for embed in embeds]
+                now = monotonic()
+                for board_message in list(board.messages):
+                    if now >= board_message.expires_at:
+                        board.messages.remove(board_message)
+                        final_embeds = self.build_embeds(board.stop, times)
+                        final_embeds[0].set_footer(text="Ce tableau n'est plus mis à jour.")
+                        await self.edit_board_message(board_message, final_embeds)
+                    elif board_message.rendered != rendered:
+                        match await self.edit_board_message(board_message, embeds):
+                            case True:
+                                board_message.rendered = rendered
+                            case None:  # the message has been deleted
+                                board.messages.remove(board_message)
+                            case False:  # retried at the next refresh
+                                pass
+        finally:
+            if self.boards.get(board.stop.ref) is board:
+                del self.boards[board.stop.ref]
+
+    @staticmethod
+    async def edit_board_message(board_message: BoardMessage, embeds: list[Embed]) -> bool | None:
+        """Edit a board message, and return whether it succeeded, or None if the message doesn't exist anymore."""
+        try:
+            await board_message.message.edit(embeds=embeds)
+        except discord.NotFound:
+            return None
+        except discord.HTTPException as e:
+            logger.warning(__("Could not edit the board {}: {}", board_message.message.jump_url, e))
+            return False
+        return True
+
+    @cts_board.autocomplete("stop_ref")
     @cts_next.autocomplete("stop_ref")
     async def extension_autocompleter(self, inter: Interaction, current: str) -> list[app_commands.Choice[str]]:
-        return [
-            app_commands.Choice(name=stop.name, value=stop.ref)
-            for stop in self.stops
-            if stop.name.lower().startswith(current.lower()) or current.lower() in stop.name.lower()
-        ][:25]
+        return [app_commands.Choice(name=stop.name, value=stop.ref) for stop in self.stops_index.search(current)]
 
 
 async def setup(bot: MP2IBot):
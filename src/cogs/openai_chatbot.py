@@ -4,11 +4,17 @@ You can communicate with ChatGPT by mentioning the bot. (Except if the API key i
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
 import re
-from collections.abc import MutableSequence
+from collections import Counter, OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
 from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime
 from functools import partial
+from time import monotonic
 from typing import TYPE_CHECKING
 
 import discord
@@ -17,6 +23,7 @@ from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam
 
 from core.errors import BaseError
+from core.utils import BraceMessage as __
 
 if TYPE_CHECKING:
     from discord import Message
@@ -24,42 +31,222 @@ if TYPE_CHECKING:
     from bot import MP2IBot
 
 
-class MessagesCache(MutableSequence[discord.Message]):
-    def __init__(self, max_size: int = 100):
-        self._internal: list[Message] = []
+logger = logging.getLogger(__name__)
+
+MESSAGE_MAX_LENGTH = 2000
+STREAM_EDIT_INTERVAL = 1.2  # in seconds, per channel: Discord allows 5 edits per 5 seconds in a channel
+
+MENTION_PATTERN = re.compile(r"<@!?1015367382727933963> ?")
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+MESSAGE_TOKENS_OVERHEAD = 4  # the role and the delimiters of each message
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text, without the tokenizer of OpenAI.
+
+    A word is about a token per 4 characters, and each punctuation character is a token. This is close enough to decide
+    how many messages fit in the prompt.
+    """
+    return sum((len(token) + 3) // 4 for token in TOKEN_PATTERN.findall(text))
+
+
+class MessagesCache:
+    """A LRU cache of the messages, by id, with their number of tokens.
+
+    Args:
+        max_size: the maximum number of messages kept.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self._internal: OrderedDict[int, Message] = OrderedDict()
+        self._tokens: dict[int, tuple[datetime | None, int]] = {}  # the tokens count, and the edition it is for
         self._max_size = max_size
-        super().__init__()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._internal)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._internal
+
+    def get(self, message_id: int) -> Message | None:
+        message = self._internal.get(message_id)
+        if message is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._internal.move_to_end(message_id)
+        return message
+
+    def add(self, message: Message) -> None:
+        self._internal[message.id] = message
+        self._internal.move_to_end(message.id)
+        if len(self._internal) > self._max_size:
+            evicted_id, _ = self._internal.popitem(last=False)
+            self._tokens.pop(evicted_id, None)
+
+    def count_tokens(self, message: Message, clean: Callable[[str], str]) -> int:
+        """Get the number of tokens of a message, once its content is cleaned by `clean` (only if not cached)."""
+        cached = self._tokens.get(message.id)
+        if cached is not None and cached[0] == message.edited_at:
+            return cached[1]
+
+        tokens = estimate_tokens(clean(message.content or "")) + MESSAGE_TOKENS_OVERHEAD
+        if message.id in self._internal:
+            self._tokens[message.id] = (message.edited_at, tokens)
+        return tokens
+
+
+@dataclass
+class QueueStats:
+    processed: int = 0
+    coalesced: int = 0  # messages merged into a request already queued
+    rejected: int = 0  # messages dropped because the queue was full
+    max_depth: int = 0
+    total_wait: float = 0  # seconds
+    max_wait: float = 0  # seconds
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.processed if self.processed else 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.processed} processed, {self.coalesced} coalesced, {self.rejected} rejected, "
+            f"max depth {self.max_depth}, wait {self.mean_wait:.1f}s mean / {self.max_wait:.1f}s max"
+        )
+
 
-    def __getitem__(self, i: int):  # type: ignore[override]
-        return self._internal.__getitem__(i)
+@dataclass
+class ChatRequest:
+    messages: list[Message]  # the messages of a user in a channel, the last one is answered
+    enqueued_at: float  # monotonic time
 
-    def __setitem__(self, i: int, o: Message):  # type: ignore[override]
-        return self._internal.__setitem__(i, o)
 
-    def __delitem__(self, i: int):  # type: ignore[override]
-        return self._internal.__delitem__(i)
+class RequestQueue:
+    """A bounded queue of the messages to answer, processed by a fixed number of workers.
 
-    def __len__(self):
-        return self._internal.__len__()
+    There is at most one queued request per user and channel: the messages sent while it is waiting are merged into it.
+    A user is never served twice at the same time, and a channel at most `max_per_channel` times, so a single user or
+    channel can't monopolize the workers.
 
-    def insert(self, index: int, value: Message):
-        if len(self) >= self._max_size:
-            self._internal.pop(0)
-        return self._internal.insert(index, value)
+    Args:
+        handler: the coroutine function answering a request.
+        max_concurrency: the number of workers, i.e. of requests processed at the same time.
+        max_queued: the maximum number of requests waiting. Further messages are rejected.
+        max_per_channel: the maximum number of requests processed at the same time in a channel.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[list[Message]], Awaitable[None]],
+        max_concurrency: int = 3,
+        max_queued: int = 20,
+        max_per_channel: int = 2,
+    ):
+        self._handler = handler
+        self._max_concurrency = max_concurrency
+        self._max_queued = max_queued
+        self._max_per_channel = max_per_channel
+
+        self._pending: OrderedDict[tuple[int, int], ChatRequest] = OrderedDict()  # by (user id, channel id)
+        self._users_in_flight: set[int] = set()
+        self._channels_in_flight: Counter[int] = Counter()
+        self._condition = asyncio.Condition()
+        self._workers: list[asyncio.Task[None]] = []
+        self.stats = QueueStats()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._max_concurrency)]
+
+    def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+
+    async def submit(self, message: Message) -> bool:
+        """Queue a message to answer, and return False if the queue is full."""
+        key = (message.author.id, message.channel.id)
+        async with self._condition:
+            if key in self._pending:
+                self._pending[key].messages.append(message)
+                self.stats.coalesced += 1
+                return True
+            if len(self._pending) >= self._max_queued:
+                self.stats.rejected += 1
+                return False
+
+            self._pending[key] = ChatRequest([message], monotonic())
+            self.stats.max_depth = max(self.stats.max_depth, len(self._pending))
+            self._condition.notify()
+        return True
+
+    def _next_key(self) -> tuple[int, int] | None:
+        """Get the oldest request whose user and channel can be served now."""
+        for key in self._pending:
+            user_id, channel_id = key
+            if user_id not in self._users_in_flight and self._channels_in_flight[channel_id] < self._max_per_channel:
+                return key
+        return None
+
+    async def _work(self) -> None:
+        while True:
+            async with self._condition:
+                while (key := self._next_key()) is None:
+                    await self._condition.wait()
+                request = self._pending.pop(key)
+                user_id, channel_id = key
+                self._users_in_flight.add(user_id)
+                self._channels_in_flight[channel_id] += 1
+
+            wait = monotonic() - request.enqueued_at
+            self.stats.processed += 1
+            self.stats.total_wait += wait
+            self.stats.max_wait = max(self.stats.max_wait, wait)
+            logger.debug(__("Answering {} message(s) after {:.2f}s in the queue.", len(request.messages), wait))
+
+            try:
+                await self._handler(request.messages)
+            except Exception:
+                logger.exception("Answering a message raised an unhandled exception.")
+            finally:
+                async with self._condition:
+                    self._users_in_flight.discard(user_id)
+                    self._channels_in_flight[channel_id] -= 1
+                    self._condition.notify_all()
 
 
 class ChatBot(Cog):
-    gpt_history_max_size = 10
+    gpt_history_max_size = 50  # the history is limited by the tokens budget, this only bounds the walk
 
     def __init__(self, bot: MP2IBot) -> None:
         self.bot = bot
-        self.messages_cache: MessagesCache = MessagesCache()
+        self.messages_cache = MessagesCache(bot.config.openai_messages_cache_size)
+        self.requests_queue = RequestQueue(
+            self.answer,
+            max_concurrency=bot.config.openai_max_concurrency,
+            max_queued=bot.config.openai_max_queued,
+            max_per_channel=bot.config.openai_max_per_channel,
+        )
+        # when the next edit is allowed in a channel, shared by all the answers streamed in it
+        self.channels_next_edit: dict[int, float] = {}
 
     async def cog_load(self) -> None:
         try:
             self.openai_client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
         except KeyError:
             raise Exception("OPENAI_API_KEY is not set in the environment variables. The extension cannot be loaded.")  # noqa: TRY002
+        self.requests_queue.start()
+
+    async def cog_unload(self) -> None:
+        self.requests_queue.stop()
+        cache = self.messages_cache
+        logger.info(__("Messages cache: {} messages, {} hits, {} misses.", len(cache), cache.hits, cache.misses))
+        logger.info(__("Requests queue: {}", self.requests_queue.stats))
 
     async def send_chat_completion(
         self,
@@ -98,64 +285,197 @@ class ChatBot(Cog):
             raise BaseError("OpenAI responded with None.")
         return answer
 
+    async def stream_chat_completion(
+        self,
+        messages: list[ChatCompletionMessageParam],
+        reply_to: Message,
+        temperature: float = 0.7,
+        top_p: float = 1,
+        stop: str | list[str] | None = None,
+        max_tokens: int | None = 250,
+        presence_penalty: float = 0,
+        frequency_penalty: float = 0,
+        user: str | None = None,
+    ) -> str:
+        """Reply to `reply_to` as soon as the first tokens are received, and edit the reply as the next ones arrive.
+
+        The edits are throttled to one every `STREAM_EDIT_INTERVAL` seconds per channel, whatever the number of answers
+        streamed in it, to stay under the rate limits of Discord.
+        """
+        create = partial(
+            self.openai_client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=messages,
+            temperature=temperature,
+            top_p=top_p,
+            n=1,
+            stop=stop,
+            frequency_penalty=frequency_penalty,
+            presence_penalty=presence_penalty,
+            stream=True,
+        )
+
+        if max_tokens is not None:
+            create = partial(create, max_tokens=max_tokens)
+        if user is not None:
+            create = partial(create, user=user)
+
+        # the response is returned once the first tokens are generated
+        async with reply_to.channel.typing():
+            stream = await create()
+
+        answer = ""
+        displayed = ""
+        reply: Message | None = None
+        channel_id = reply_to.channel.id
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            answer += chunk.choices[0].delta.content
+
+            if reply is None:
+                if answer.strip():
+                    reply = await reply_to.reply(answer[:MESSAGE_MAX_LENGTH])
+                    displayed = answer
+                    self.reserve_edit(channel_id)  # the next edit comes after the throttling interval
+            elif self.try_reserve_edit(channel_id):
+                await reply.edit(content=answer[:MESSAGE_MAX_LENGTH])
+                displayed = answer
+
+        if reply is None:
+            raise BaseError("OpenAI responded with None.")
+        if answer != displayed:
+            # the last edit can't be skipped, so it waits for its turn
+            await asyncio.sleep(self.reserve_edit(channel_id))
+            await reply.edit(content=answer[:MESSAGE_MAX_LENGTH])
+        return answer
+
+    def try_reserve_edit(self, channel_id: int) -> bool:
+        """Reserve an edit in a channel, if one can be made now."""
+        if monotonic() < self.channels_next_edit.get(channel_id, 0):
+            return False
+        self.reserve_edit(channel_id)
+        return True
+
+    def reserve_edit(self, channel_id: int) -> float:
+        """Reserve the next edit slot of a channel, and get the delay before it."""
+        now = monotonic()
+        slot = max(now, self.channels_next_edit.get(channel_id, 0))
+        self.channels_next_edit[channel_id] = slot + STREAM_EDIT_INTERVAL
+        return slot - now
+
     def clean_content(self, content: str) -> str:
         # TODO : replace mentions with usernames ?
-        regex = re.compile(r"<@!?1015367382727933963> ?")
-        return regex.sub("", content, 0)
+        return MENTION_PATTERN.sub("", content, 0)
 
-    async def get_history(self, message: Message) -> list[ChatCompletionMessageParam]:
-        messages: list[ChatCompletionMessageParam] = []
+    async def get_history(self, message: Message, previous: Sequence[Message] = ()) -> list[ChatCompletionMessageParam]:
+        """Get the conversation leading to `message`, within `openai_history_max_tokens`.
 
-        async def inner(msg: Message):
-            if len(messages) >= self.gpt_history_max_size:
-                return
+        The oldest messages are dropped first, but `message` itself is always kept.
 
-            if msg not in self.messages_cache:
-                self.messages_cache.append(msg)
+        Args:
+            message: the message to answer.
+            previous: other messages sent by the user just before, inserted before `message` if it doesn't reply to
+                them.
+        """
+        budget = self.bot.config.openai_history_max_tokens
+        chain = await self.get_reply_chain(message, budget)
+        in_chain = {msg.id for msg in chain}
+        newest_first = [message, *reversed([msg for msg in previous if msg.id not in in_chain]), *chain[1:]]
+
+        kept: list[Message] = []
+        total = 0
+        for msg in newest_first:
+            tokens = self.count_tokens(msg)
+            if kept and total + tokens > budget:
+                break
+            kept.append(msg)
+            total += tokens
+        logger.info(
+            __(
+                "History of {}: {} messages, ~{} tokens, {} dropped (budget {}).",
+                message.id,
+                len(kept),
+                total,
+                len(newest_first) - len(kept),
+                budget,
+            )
+        )
 
-            me = self.bot.user.id  # type: ignore
+        me = self.bot.user.id  # type: ignore
+        messages: list[ChatCompletionMessageParam] = []
+        for msg in reversed(kept):
             content = self.clean_content(msg.content or "")
-            chat: ChatCompletionMessageParam
-            if message.author.id == me:
-                chat = {"role": "assistant", "content": content}
+            if msg.author.id == me:
+                messages.append({"role": "assistant", "content": content})
             else:
-                chat = {"role": "user", "content": content}
-            messages.insert(0, chat)
-
-            if msg.reference is None:
-                return
-
-            match resolved := msg.reference.resolved:
-                case None:
-                    if msg.reference.message_id is None:
-                        return
-
-                    cached = next(
-                        (m for m in self.messages_cache if m.id == msg.reference.message_id),
-                        None,
-                    )
-                    if cached is not None:
-                        await inner(cached)
-                        return
-
-                    try:
-                        msg = await msg.channel.fetch_message(msg.reference.message_id)
-                    except (discord.NotFound, discord.HTTPException):
-                        pass
-                    else:
-                        await inner(msg)
-                case discord.Message():
-                    await inner(resolved)
-                case discord.DeletedReferencedMessage():
-                    pass
-
-        await inner(message)
+                messages.append({"role": "user", "content": content})
         return messages
 
-    async def ask_to_openai(self, message: Message) -> None:
+    def count_tokens(self, message: Message) -> int:
+        return self.messages_cache.count_tokens(message, self.clean_content)
+
+    async def get_reply_chain(self, message: Message, max_tokens: int | None = None) -> list[Message]:
+        """Get the message and the messages it replies to, from the newest to the oldest.
+
+        The messages are recorded by `on_message` as they arrive, so the chain is usually built from the cache. Missing
+        messages are fetched once, with the messages around them, so it takes at most one request.
+
+        Args:
+            message: the last message of the chain.
+            max_tokens: stop once the messages of the chain exceed this number of tokens.
+        """
+        chain = [message]
+        tokens = self.count_tokens(message)
+        fetched = False
+        while len(chain) < self.gpt_history_max_size and (max_tokens is None or tokens < max_tokens):
+            parent_id = self.get_parent_id(chain[-1])
+            if parent_id is None:
+                break
+
+            parent = self.messages_cache.get(parent_id)
+            if parent is None:
+                if fetched:
+                    break
+                fetched = True
+                await self.fetch_around(message.channel, parent_id)
+                parent = self.messages_cache.get(parent_id)
+                if parent is None:
+                    break
+            chain.append(parent)
+            tokens += self.count_tokens(parent)
+        return chain
+
+    def get_parent_id(self, message: Message) -> int | None:
+        reference = message.reference
+        if reference is None or reference.message_id is None or reference.channel_id != message.channel.id:
+            return None
+
+        match reference.resolved:
+            case discord.DeletedReferencedMessage():
+                return None
+            case discord.Message() as resolved:
+                self.messages_cache.add(resolved)
+            case None:
+                pass
+        return reference.message_id
+
+    async def fetch_around(self, channel: discord.abc.MessageableChannel, message_id: int) -> None:
+        try:
+            async for msg in channel.history(limit=100, around=discord.Object(message_id)):
+                self.messages_cache.add(msg)
+        except discord.HTTPException as e:
+            logger.warning(__("Could not fetch the messages around {}: {}", message_id, e))
+
+    async def answer(self, messages: list[Message]) -> None:
+        """Answer the last of the messages sent by a user in a channel while the request was queued."""
+        await self.ask_to_openai(messages[-1], messages[:-1])
+
+    async def ask_to_openai(self, message: Message, previous: Sequence[Message] = ()) -> None:
         """
         Args:
             message (Message): the message object
+            previous: other messages sent by the user just before, see `get_history`.
         """
 
         messages: list[ChatCompletionMessageParam] = []
@@ -169,25 +489,32 @@ class ChatBot(Cog):
 
         messages.append({"role": "system", "content": f"The user is called {username}."})
 
-        messages.extend(await self.get_history(message))
+        messages.extend(await self.get_history(message, previous))
 
-        response = await self.send_chat_completion(messages, message.channel, user=username)
-        await message.reply(response)
+        if self.bot.config.openai_streaming:
+            await self.stream_chat_completion(messages, message, user=username)
+        else:
+            response = await self.send_chat_completion(messages, message.channel, user=username)
+            await message.reply(response)
 
     @Cog.listener()
     async def on_message(self, message: Message) -> None:
-        if (
-            message.guild is not None
-            and message.guild.id == self.bot.config.guild_id
-            and message.author.id != message.guild.me.id
-            and (
-                message.guild.me in message.mentions
-                or message.reference is not None
-                and isinstance(message.reference.resolved, discord.Message)
-                and message.reference.resolved.author.id == message.guild.me.id
-            )
+        if message.guild is None or message.guild.id != self.bot.config.guild_id:
+            return
+
+        # any message can be replied to later, including the answers of the bot
+        self.messages_cache.add(message)
+
+        if message.author.id == message.guild.me.id or not (
+            message.guild.me in message.mentions
+            or message.reference is not None
+            and isinstance(message.reference.resolved, discord.Message)
+            and message.reference.resolved.author.id == message.guild.me.id
         ):
-            await self.ask_to_openai(message)
+            return
+
+        if not await self.requests_queue.submit(message):
+            await message.reply("Trop de demandes en cours, réessaye dans quelques instants.", delete_after=10)
 
 
 async def setup(bot: MP2IBot) -> None:
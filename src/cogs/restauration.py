@@ -12,12 +12,13 @@ from os import path
 from typing import TYPE_CHECKING, cast
 
 import discord
-import httpx
 from bs4 import BeautifulSoup
 from discord import HTTPException, TextChannel, app_commands
 from discord.ext import tasks
 from discord.ext.commands import Cog  # pyright: ignore[reportMissingTypeStubs]
 
+from core.http_client import http_client
+
 if TYPE_CHECKING:
     from bot import MP2IBot
 
@@ -72,9 +73,8 @@ class Restauration(Cog):
         Returns:
             A tuple with fr:MENUs, and a second tuple with fr:ALLERGENES.
         """
-        async with httpx.AsyncClient() as client:
-            result = await client.get("https://lycee-kleber.com.fr/restauration", follow_redirects=True)
-            page = result.text
+        result = await http_client.get("https://lycee-kleber.com.fr/restauration", follow_redirects=True)
+        page = result.text
 
         scrap = BeautifulSoup(page, "html.parser")
         element = scrap.find_all("a", href=lambda r: bool(IMAGES_REGEX.match(cast(str, r))))
@@ -10,7 +10,7 @@ from __future__ import annotations
 import logging
 import tomllib
 from pathlib import Path
-from typing import Any, ClassVar, Self
+from typing import Any, ClassVar, Literal, Self
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +45,24 @@ class Config:
         "openai_chatbot",
         "colloscope_helper",
     ]
+    colloscope_cache_size: ClassVar[int] = 64
+    colloscope_cache_on_disk: ClassVar[bool] = False
+    colloscope_workers_kind: ClassVar[Literal["thread", "process"]] = "thread"
+    colloscope_workers: ClassVar[int] = 2
+    colloscope_max_pending_renders: ClassVar[int] = 16
+    http2: ClassVar[bool] = False
+    http_timeout: ClassVar[float] = 10
+    http_connect_timeout: ClassVar[float] = 5
+    http_max_connections_per_host: ClassVar[int] = 10
+    cts_hot_stops: ClassVar[list[str]] = []  # LogicalStopCode of the stops to prefetch
+    cts_class_end_times: ClassVar[list[str]] = ["10:00", "12:00", "14:00", "16:00", "17:00", "18:00"]
+    cts_night: ClassVar[tuple[str, str]] = ("22:00", "06:00")
+    openai_messages_cache_size: ClassVar[int] = 1000
+    openai_streaming: ClassVar[bool] = True
+    openai_max_concurrency: ClassVar[int] = 3
+    openai_max_queued: ClassVar[int] = 20
+    openai_max_per_channel: ClassVar[int] = 2
+    openai_history_max_tokens: ClassVar[int] = 1500
 
     _instance: ClassVar[Self] | None = None
     _defined: ClassVar[bool] = False
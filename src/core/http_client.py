@@ -0,0 +1,112 @@
+"""
+A HTTP client shared by the whole bot.
+
+Opening a new `httpx.AsyncClient` for every request means a new TCP (and TLS) handshake every time. Instead, the
+libraries and the cogs should use `http_client`, which keeps the connections alive for the lifetime of the bot.
+It also records how many requests are made to each host, and how long they take.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+from core._config import config
+from core.utils import BraceMessage as __
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    total_latency: float = 0  # seconds
+    max_latency: float = 0  # seconds
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests, {self.errors} errors, "
+            f"{self.mean_latency * 1000:.0f}ms mean, {self.max_latency * 1000:.0f}ms max"
+        )
+
+
+class HTTPClient:
+    """A wrapper around a single `httpx.AsyncClient`, with a limited number of connections per host.
+
+    The underlying client is created on the first request, so the configuration is read once the bot is running.
+    """
+
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+        self._hosts_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.stats: dict[str, HostStats] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    @staticmethod
+    def _create_client() -> httpx.AsyncClient:
+        http2 = config.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 is enabled, but the h2 package is not installed. Falling back to HTTP/1.1.")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(config.http_timeout, connect=config.http_connect_timeout),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=20, keepalive_expiry=30),
+        )
+
+    def _get_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._hosts_semaphores:
+            self._hosts_semaphores[host] = asyncio.Semaphore(config.http_max_connections_per_host)
+        return self._hosts_semaphores[host]
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = urlsplit(url).netloc
+        stats = self.stats.setdefault(host, HostStats())
+
+        async with self._get_semaphore(host):
+            start = time.perf_counter()
+            try:
+                return await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError:
+                stats.errors += 1
+                raise
+            finally:
+                latency = time.perf_counter() - start
+                stats.requests += 1
+                stats.total_latency += latency
+                stats.max_latency = max(stats.max_latency, latency)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    def get_host_stats(self, url: str) -> HostStats:
+        """Get the stats of the host of `url`."""
+        return self.stats.setdefault(urlsplit(url).netloc, HostStats())
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        for host, stats in self.stats.items():
+            logger.info(__("{}: {}", host, stats))
+
+
+http_client = HTTPClient()
@@ -1,28 +1,129 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
 from os import environ
 from typing import TYPE_CHECKING, Any
 from urllib.parse import urljoin
 
 import httpx
 
+from core._config import config
+from core.errors import BaseError
+from core.http_client import http_client
+from core.utils import BraceMessage as __
+
+from .circuit_breaker import CircuitBreaker, CircuitState
+from .decoding import StopTime, decode_stop_times
+
 if TYPE_CHECKING:
+    from core.http_client import HostStats
+
     # TODO: maybe consider using pydantic ?
     from .models import ResponseLinesDiscoveryList, ResponseStopMonitoringList, ResponseStopPointsDiscoveryList
 
-API_BASE_URL = "https://api.cts-strasbourg.eu"
+logger = logging.getLogger(__name__)
+
+# can be changed to use a stand-in of the API, like bin/cts_stand_in.py
+API_BASE_URL = environ.get("CTS_API_BASE_URL", "https://api.cts-strasbourg.eu")
 CTS_TOKEN: str = environ["CTS_TOKEN"]
 
+# The stop monitoring data is refreshed by the API about every 30 seconds, there is no need to ask more often.
+STOP_TIMES_TTL = 30
+
+# The failed requests (network errors, 429 and 5xx) are retried, as long as the whole call stays within the budget.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 3
+LATENCY_BUDGET = 8  # seconds
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 4  # seconds
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0  # requests that waited for an identical request already in flight
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.coalesced} coalesced"
+
+
+stop_times_cache_stats = CacheStats()
+_stop_times_cache: dict[str, tuple[float, list[StopTime]]] = {}
+_stop_times_in_flight: dict[str, asyncio.Task[list[StopTime]]] = {}
+
+api_circuit_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
 
 async def _get_request(uri: str, params: dict[str, Any] | None = None) -> httpx.Response:
+    """Make a GET request to the CTS API.
+
+    The failed requests are retried with a jittered exponential backoff, within `LATENCY_BUDGET` seconds. If the API
+    keeps failing, the circuit breaker is opened and the next calls fail immediately, without waiting for it.
+
+    Raises:
+        BaseError: the API is unavailable, or refused the request.
+    """
     if not uri.startswith(API_BASE_URL):
         uri = urljoin(API_BASE_URL, uri)
 
+    if not api_circuit_breaker.allow_request():
+        raise BaseError("L'API de la CTS est indisponible pour le moment, réessaye dans quelques instants.")
+
     auth = (CTS_TOKEN, "")
-    async with httpx.AsyncClient() as client:
-        response = await client.get(uri, params=params, auth=auth)  # type: ignore # don't know why pyright complain about client.get
-        # TODO: handle response status code
-    return response
+    deadline = time.monotonic() + LATENCY_BUDGET
+    try:
+        for attempt in range(MAX_ATTEMPTS):
+            timeout = min(config.http_timeout, deadline - time.monotonic())
+            retry_after: float | None = None
+            try:
+                response = await http_client.get(uri, params=params, auth=auth, timeout=timeout)
+            except httpx.HTTPError as e:  # network errors, but also decoding errors, too many redirects...
+                logger.warning(__("Request to {} failed (attempt {}): {!r}", uri, attempt + 1, e))
+            else:
+                if response.is_success:
+                    api_circuit_breaker.record_success()
+                    return response
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # the API answered, so it is up, but retrying the same request won't help
+                    api_circuit_breaker.record_success()
+                    logger.error(__("Request to {} refused with status {}.", uri, response.status_code))
+                    raise BaseError("L'API de la CTS a refusé la requête.")
+                logger.warning(__("Request to {} failed (attempt {}): {}", uri, attempt + 1, response.status_code))
+                retry_after = _parse_retry_after(response)
+
+            # "full jitter": the clients waiting for the API to recover don't all come back at the same time
+            delay = retry_after or random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))  # noqa: S311
+            if attempt == MAX_ATTEMPTS - 1 or time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+    except BaseException:
+        # cancelled, or an unexpected error: the outcome is unknown, but a trial call must not stay in flight forever
+        api_circuit_breaker.cancel_trial()
+        raise
+
+    api_circuit_breaker.record_failure()
+    if api_circuit_breaker.state is CircuitState.open:
+        logger.warning(
+            __("The CTS API keeps failing, no request will be made for {}s.", api_circuit_breaker.reset_timeout)
+        )
+    raise BaseError("L'API de la CTS ne répond pas correctement, réessaye dans quelques instants.")
+
+
+def _parse_retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if value is None or not value.isdigit():  # the HTTP date format is ignored
+        return None
+    return float(value)
+
+
+def get_stats() -> HostStats:
+    """Get the number of requests made to the CTS API, and their latencies."""
+    return http_client.get_host_stats(API_BASE_URL)
 
 
 async def get_stops() -> ResponseStopPointsDiscoveryList:
@@ -35,7 +136,39 @@ async def get_lines() -> ResponseLinesDiscoveryList:
     return response.json()
 
 
-async def get_stop_times(stop_ref: str) -> ResponseStopMonitoringList:
+async def get_stop_times(stop_ref: str) -> list[StopTime]:
+    """Get the next buses and trams for a stop.
+
+    The responses are cached for `STOP_TIMES_TTL` seconds, and concurrent calls for the same stop share a single
+    request. The returned value must not be modified.
+    """
+    cached = _stop_times_cache.get(stop_ref)
+    if cached is not None and time.monotonic() - cached[0] < STOP_TIMES_TTL:
+        stop_times_cache_stats.hits += 1
+        return cached[1]
+
+    task = _stop_times_in_flight.get(stop_ref)
+    if task is not None:
+        stop_times_cache_stats.coalesced += 1
+    else:
+        stop_times_cache_stats.misses += 1
+        task = asyncio.create_task(_fetch_stop_times(stop_ref))
+        _stop_times_in_flight[stop_ref] = task
+        task.add_done_callback(lambda _: _stop_times_in_flight.pop(stop_ref, None))
+
+    # shield the request, so a cancelled caller doesn't cancel it for the others
+    return await asyncio.shield(task)
+
+
+async def _fetch_stop_times(stop_ref: str) -> list[StopTime]:
     params = {"MonitoringRef": stop_ref}
     response = await _get_request("/v1/siri/2.0/stop-monitoring", params=params)
-    return response.json()
+    payload: ResponseStopMonitoringList = response.json()
+    result = decode_stop_times(payload)
+
+    now = time.monotonic()
+    for key, (timestamp, _) in list(_stop_times_cache.items()):  # drop the expired entries
+        if now - timestamp >= STOP_TIMES_TTL:
+            del _stop_times_cache[key]
+    _stop_times_cache[stop_ref] = (now, result)
+    return result
@@ -0,0 +1,66 @@
+"""
+A circuit breaker, to stop sending requests to an API that keeps failing.
+
+After `failure_threshold` consecutive failures, the circuit is opened: the calls fail immediately, without waiting for
+an API that is very likely to fail again. After `reset_timeout` seconds, a single trial call is let through (the
+circuit is half-open): if it succeeds, the circuit is closed again, otherwise it is reopened.
+"""
+
+from __future__ import annotations
+
+import time
+from enum import Enum
+
+
+class CircuitState(Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half-open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0  # consecutive failures
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        if self.opened_at is None:
+            return CircuitState.closed
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return CircuitState.open
+        return CircuitState.half_open
+
+    def allow_request(self) -> bool:
+        match self.state:
+            case CircuitState.closed:
+                return True
+            case CircuitState.open:
+                return False
+            case CircuitState.half_open:
+                if self.trial_in_flight:
+                    return False
+                self.trial_in_flight = True
+                return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def cancel_trial(self) -> None:
+        """Let another trial call through, if the current one has been cancelled before its outcome was known."""
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def __str__(self) -> str:
+        return f"{self.state.value}, {self.failures} consecutive failures"
@@ -0,0 +1,79 @@
+"""
+Decode the SIRI payloads of the CTS API into small records.
+
+A stop-monitoring response is a deep tree of dicts, of which only four fields per vehicle are used. Instead of keeping
+(and caching) the whole tree, the fields are extracted once, when the response is received.
+"""
+
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import TYPE_CHECKING, Literal
+
+from core.errors import BaseError
+
+if TYPE_CHECKING:
+    from .models import ResponseStopMonitoringList
+
+
+EPOCH = datetime(1970, 1, 1)  # naive, like the local date and time parsed below
+SECOND = timedelta(seconds=1)
+
+
+# not frozen: the frozen dataclasses are about 3 times slower to create
+@dataclass(slots=True)
+class StopTime:
+    type: Literal["bus", "tram"]
+    destination: str
+    line: str
+    arrival: int  # unix timestamp
+
+
+@lru_cache(maxsize=16)
+def parse_utc_offset(value: str) -> int:
+    """Convert an UTC offset (e.g. +01:00) to seconds."""
+    offset = datetime.fromisoformat(f"2000-01-01T00:00:00{value}").utcoffset()
+    return offset // SECOND if offset else 0
+
+
+@lru_cache(maxsize=4096)
+def parse_arrival_time(value: str) -> int:
+    """Convert an ISO 8601 date (e.g. 2024-03-11T14:35:28+01:00) to a unix timestamp.
+
+    The predictions of a vehicle rarely change between two refreshes, and many stops are served at the same times, so
+    the same strings are parsed again and again: they are cached.
+    `datetime.timestamp()` is slow with a fixed UTC offset, so the epoch is computed from the local date and time, and
+    the offset (always the same one or two) is subtracted.
+    """
+    if len(value) == 25 and value[19] in "+-":  # YYYY-MM-DDTHH:MM:SS+HH:MM
+        return (datetime.fromisoformat(value[:19]) - EPOCH) // SECOND - parse_utc_offset(value[19:])
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def decode_stop_times(response: ResponseStopMonitoringList) -> list[StopTime]:
+    """Extract the next buses and trams from a stop-monitoring response."""
+    deliveries = response["ServiceDelivery"]["StopMonitoringDelivery"]
+    if not deliveries:
+        raise BaseError("Quelque chose de plutôt inattendu s'est passé !")
+
+    intern, parse = sys.intern, parse_arrival_time
+    times: list[StopTime] = []
+    for visit in deliveries[0]["MonitoredStopVisit"]:
+        vehicle = visit["MonitoredVehicleJourney"]
+        mode = vehicle["VehicleMode"]
+        if mode != "bus" and mode != "tram":
+            continue
+
+        # the strings are interned, so the cached records don't keep a copy of them per vehicle
+        times.append(
+            StopTime(
+                mode,
+                intern(vehicle["DestinationName"] or "??"),
+                intern(vehicle["LineRef"] or "??"),
+                parse(vehicle["MonitoredCall"]["ExpectedArrivalTime"]),
+            )
+        )
+    return times
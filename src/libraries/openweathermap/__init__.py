@@ -4,9 +4,13 @@ from os import environ
 from typing import TYPE_CHECKING, Any, Literal
 from urllib.parse import urljoin
 
-import httpx
+from core.http_client import http_client
 
 if TYPE_CHECKING:
+    import httpx
+
+    from core.http_client import HostStats
+
     from .models import WeatherResponse
 
 
@@ -18,8 +22,7 @@ async def _get(uri: str, params: dict[str, Any]) -> httpx.Response:
     if not uri.startswith(API_BASE_URL):
         uri = urljoin(API_BASE_URL, uri)
     params.setdefault("appid", APP_KEY)
-    async with httpx.AsyncClient() as client:
-        return await client.get(uri, params=params)
+    return await http_client.get(uri, params=params)
 
 
 async def get_weather(
@@ -35,5 +38,10 @@ async def get_weather(
     return result.json()
 
 
+def get_stats() -> HostStats:
+    """Get the number of requests made to the OpenWeatherMap API, and their latencies."""
+    return http_client.get_host_stats(API_BASE_URL)
+
+
 def get_icon(code: str) -> str:
     return f"https://openweathermap.org/img/wn/{code}@4x.png"